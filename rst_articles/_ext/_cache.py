@@ -0,0 +1,57 @@
+import os
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+
+from rst_articles.defaults import default_cache_dir
+
+
+CACHE_DIR_CONFIG = 'rst_articles_cache_dir'
+
+
+def add_cache_config(app):
+	if CACHE_DIR_CONFIG not in app.config:
+		app.add_config_value(CACHE_DIR_CONFIG, str(default_cache_dir), '')
+
+
+def cache_dir(app, name: str) -> Path:
+	path = Path(getattr(app.config, CACHE_DIR_CONFIG)) / name
+	path.mkdir(parents=True, exist_ok=True)
+	return path
+
+
+def digest(*parts: str | bytes) -> str:
+	hasher = hashlib.sha256()
+	for part in parts:
+		if isinstance(part, str):
+			part = part.encode()
+		hasher.update(hashlib.sha256(part).digest())
+	return hasher.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+	with open(path, 'rb') as file:
+		return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def load(path: Path):
+	try:
+		with open(path, 'rb') as file:
+			return pickle.load(file)
+	except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+		return None
+
+
+def store(path: Path, value):
+	# Written to a sibling file and renamed, so concurrent builds sharing
+	# the cache never see a partial entry
+	path.parent.mkdir(parents=True, exist_ok=True)
+	fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+	try:
+		with os.fdopen(fd, 'wb') as file:
+			pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, path)
+	except BaseException:
+		os.unlink(tmp)
+		raise
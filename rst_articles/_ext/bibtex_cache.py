@@ -0,0 +1,163 @@
+import ast
+from pathlib import Path
+from importlib import metadata
+
+import sphinxcontrib.bibtex
+from sphinxcontrib.bibtex.bibfile import (
+	BibData,
+	BibFile,
+	get_mtime,
+	is_bibdata_outdated,
+	parse_bibdata,
+)
+from sphinxcontrib.bibtex.domain import BibtexDomain
+from sphinx.util import logging
+
+from _cache import (
+	add_cache_config,
+	cache_dir,
+	digest,
+	file_digest,
+	load,
+	store,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Parsed .bib files and formatted bibliographies are pickled in the shared
+# cache directory, keyed by content, so they survive `-E` builds and are
+# reused by every article pointing at the same bibliography
+_get_formatted_entries = BibtexDomain.get_formatted_entries
+
+_app = None
+_bib_digests: dict[Path, str] = {}
+
+
+def _package_version(package: str) -> str:
+	try:
+		return metadata.version(package)
+	except metadata.PackageNotFoundError:
+		return ''
+
+
+# Parsing and formatting change between releases of either package
+_versions = (
+	_package_version('pybtex'),
+	_package_version('sphinxcontrib-bibtex'),
+)
+
+
+def _bibdata_digest(bibfilenames: list[Path], encoding: str) -> str:
+	for filename in bibfilenames:
+		if filename.is_file():
+			_bib_digests[filename] = file_digest(filename)
+		else:
+			_bib_digests[filename] = ''
+
+	return digest(*_versions, encoding, *(
+		_bib_digests[filename]
+		for filename in bibfilenames
+	))
+
+
+def cached_process_bibdata(
+	bibdata: BibData,
+	bibfilenames: list[Path],
+	encoding: str,
+) -> BibData:
+	bibdata_digest = _bibdata_digest(bibfilenames, encoding)
+
+	if not is_bibdata_outdated(bibdata, bibfilenames, encoding):
+		return bibdata
+
+	cache_file = cache_dir(_app, 'bibtex') / f"{bibdata_digest}.bibdata"
+
+	cached = load(cache_file)
+	if cached is not None:
+		logger.info("bibtex cache hit for %s", cache_file.stem[:12])
+		keys, data = cached
+		return BibData(
+			encoding=encoding,
+			bibfiles={
+				filename: BibFile(
+					mtime=get_mtime(filename),
+					keys=dict.fromkeys(file_keys),
+				)
+				for filename, file_keys in zip(bibfilenames, keys)
+			},
+			data=data,
+		)
+
+	bibdata = parse_bibdata(bibfilenames, encoding)
+	store(cache_file, (
+		[list(bibfile.keys) for bibfile in bibdata.bibfiles.values()],
+		bibdata.data,
+	))
+	return bibdata
+
+
+def cached_get_formatted_entries(
+	self: BibtexDomain,
+	bibliography_key,
+	docnames: list[str],
+	tooltips: bool,
+	tooltips_style: str,
+):
+	bibliography = self.bibliographies[bibliography_key]
+
+	# Everything the entry selection, sorting and labels depend on
+	key = digest(
+		*_versions,
+		*(_bib_digests.get(bibfile, '') for bibfile in bibliography.bibfiles),
+		bibliography.style,
+		bibliography.labelprefix,
+		bibliography.keyprefix,
+		ast.dump(bibliography.filter_),
+		repr(list(bibliography.keys)),
+		bibliography_key.docname,
+		repr([
+			(ref.docname, [target.key for target in ref.targets])
+			for ref in self.citation_refs
+		]),
+		repr(docnames),
+		repr((tooltips, tooltips_style)),
+	)
+	cache_file = cache_dir(_app, 'bibtex') / f"{key}.formatted"
+
+	cached = load(cache_file)
+	if cached is not None:
+		entries = self.bibdata.data.entries
+		if all(entry_key in entries for entry_key, _, _ in cached):
+			for entry_key, formatted_entry, tooltip_entry in cached:
+				yield entries[entry_key], formatted_entry, tooltip_entry
+			return
+
+	formatted = []
+	for entry, formatted_entry, tooltip_entry in _get_formatted_entries(
+		self,
+		bibliography_key,
+		docnames,
+		tooltips,
+		tooltips_style,
+	):
+		formatted.append((entry.key, formatted_entry, tooltip_entry))
+		yield entry, formatted_entry, tooltip_entry
+
+	store(cache_file, formatted)
+
+
+def setup(app):
+	global _app
+	_app = app
+
+	add_cache_config(app)
+
+	sphinxcontrib.bibtex.process_bibdata = cached_process_bibdata
+	BibtexDomain.get_formatted_entries = cached_get_formatted_entries
+
+	return {
+		'version': '0.1',
+		'parallel_read_safe': True,
+		'parallel_write_safe': True,
+	}
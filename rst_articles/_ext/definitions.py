@@ -1,6 +1,6 @@
 import re
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, astuple
 
 import wikipedia
 
@@ -13,6 +13,8 @@ from sphinx.transforms import SphinxTransform
 
 ENV_DEFS_KEY = 'definitions'
 ENV_SEEN_KEY = 'seen_abbreviations'
+ENV_DEF_DOCS_KEY = 'definition_docs'
+ENV_RESOLVED_KEY = 'resolved_definitions'
 DEF_PATH = Path('source/definitions')
 DEF_PATH.mkdir(parents=True, exist_ok=True)
 
@@ -62,8 +64,13 @@ class NewDefinitionDirective(SphinxDirective):
 			setattr(env, ENV_DEFS_KEY, dict())
 		definitions = getattr(env, ENV_DEFS_KEY)
 
+		if not hasattr(env, ENV_DEF_DOCS_KEY):
+			setattr(env, ENV_DEF_DOCS_KEY, dict())
+		definition_docs = getattr(env, ENV_DEF_DOCS_KEY)
+
 		abb = self.arguments[0]
 
+		definition_docs.setdefault(env.docname, set()).add(abb)
 		definitions[abb] = Definition(
 			short=self.options.get('short', abb),
 			long=self.options.get('long'),
@@ -91,28 +98,104 @@ def abbrev_role(role, raw_text, text, lineno, inliner, options={}, content=[]):
 	return [node], []
 
 
+@dataclass
+class ResolvedDefinitions:
+	signature: tuple
+	# key -> (label on first use, label afterwards)
+	labels: dict[str, tuple[str, str]]
+	# (term, description) pairs for the definition list
+	entries: list[tuple[str, str]]
+
+
+def get_description(d):
+	if d.description:
+		return d.description
+
+	if d.search is None:
+		return None
+
+	cache_file = DEF_PATH / f"{d.search.replace('/', '_')}.txt"
+
+	if cache_file.exists():
+		text = cache_file.read_text()
+	else:
+		wikipedia.set_lang(d.language)
+		text = wikipedia.summary(d.search)
+		text = wiki_ref_pattern.sub('', text).replace('\n', ' ').strip()
+		cache_file.write_text(text)
+
+	if d.max_sentences > 0:
+		matches = list(def_sent_pattern.finditer(text))
+		if len(matches) >= d.max_sentences:
+			text = text[:matches[d.max_sentences - 1].end() - 1]
+	return text
+
+
+def purge_definitions(app, env, docname):
+	definition_docs = getattr(env, ENV_DEF_DOCS_KEY, {})
+	definitions = getattr(env, ENV_DEFS_KEY, {})
+
+	for key in definition_docs.pop(docname, ()):
+		definitions.pop(key, None)
+
+
+def resolve_definitions(app, env):
+	'''Renders labels and the definition list once, after the read phase.
+
+	The result is kept on the environment and only recomputed when the
+	``new-def`` directives changed since the last build.
+	'''
+
+	defs = getattr(env, ENV_DEFS_KEY, {})
+	signature = tuple(sorted(
+		(key, astuple(d))
+		for key, d in defs.items()
+	))
+
+	# Abbreviations are expanded on first use within each write phase
+	setattr(env, ENV_SEEN_KEY, set())
+
+	resolved = getattr(env, ENV_RESOLVED_KEY, None)
+	if resolved is not None and resolved.signature == signature:
+		return
+
+	labels = {}
+	entries = []
+	for key, d in defs.items():
+		term_text = f"{d.long} ({d.short})" if d.long else d.short
+		labels[key] = (term_text, d.short)
+
+		desc = get_description(d)
+		if desc is not None:
+			entries.append((term_text, desc))
+
+	setattr(env, ENV_RESOLVED_KEY, ResolvedDefinitions(
+		signature=signature,
+		labels=labels,
+		entries=entries,
+	))
+
+
 class ResolveDefinitions(SphinxTransform):
 	default_priority = 111
 
 	def apply(self):
 		env = self.document.settings.env
-		defs = getattr(env, ENV_DEFS_KEY)
+		resolved = getattr(env, ENV_RESOLVED_KEY, None)
 		if not hasattr(env, ENV_SEEN_KEY):
 			setattr(env, ENV_SEEN_KEY, set())
 		registry = getattr(env, ENV_SEEN_KEY)
 
 		for node in self.document.traverse(AbbrevPlaceholder):
 			key = node.attributes['key']
-			d = defs.get(key)
-			if not d:
+			if resolved is None or key not in resolved.labels:
 				node.replace_self(nodes.problematic('', key))
 				continue
 
-			if key not in registry and d.long:
-				label = f"{d.long} ({d.short})"
+			first_label, label = resolved.labels[key]
+			if key not in registry:
 				registry.add(key)
-			else:
-				label = d.short
+				label = first_label
 			node.replace_self(nodes.Text(label))
 
 
@@ -121,51 +204,21 @@ class ResolveDefinitionList(SphinxTransform):
 
 	def apply(self):
 		env = self.document.settings.env
-		if not hasattr(env, ENV_DEFS_KEY):
-			setattr(env, ENV_DEFS_KEY, dict())
-		defs = getattr(env, ENV_DEFS_KEY)
+		resolved = getattr(env, ENV_RESOLVED_KEY, None)
 
 		for node in self.document.traverse(DefinitionListPlaceholder):
-			if not defs:
+			if resolved is None or not resolved.labels:
 				node.replace_self(nodes.problematic("", "No definitions found"))
 				continue
 
 			dl = nodes.definition_list()
-			for key, d in defs.items():
-				desc = self._get_description(d)
-				if desc is None:
-					continue
-
-				term_text = f"{d.long} ({d.short})" if d.long else d.short
+			for term_text, desc in resolved.entries:
 				li = nodes.definition_list_item()
 				li += nodes.term('', term_text)
 				li += nodes.definition('', nodes.paragraph('', desc))
 				dl += li
 			node.replace_self(dl)
 
-	def _get_description(self, d):
-		if d.description:
-			return d.description
-
-		if d.search is None:
-			return None
-
-		cache_file = DEF_PATH / f"{d.search.replace('/', '_')}.txt"
-
-		if cache_file.exists():
-			text = cache_file.read_text()
-		else:
-			wikipedia.set_lang(d.language)
-			text = wikipedia.summary(d.search)
-			text = wiki_ref_pattern.sub('', text).replace('\n', ' ').strip()
-			cache_file.write_text(text)
-
-		if d.max_sentences > 0:
-			matches = list(def_sent_pattern.finditer(text))
-			if len(matches) >= d.max_sentences:
-				text = text[:matches[d.max_sentences - 1].end() - 1]
-		return text
-
 
 def setup(app):
 	app.add_node(AbbrevPlaceholder)
@@ -178,6 +231,9 @@ def setup(app):
 
 	app.add_post_transform(ResolveDefinitions)
 	app.add_post_transform(ResolveDefinitionList)
+
+	app.connect('env-purge-doc', purge_definitions)
+	app.connect('env-updated', resolve_definitions)
 	return {
 		'version': '0.1',
 		'parallel_read_safe': False,
@@ -0,0 +1,201 @@
+import multiprocessing
+from functools import cache
+from concurrent.futures import ProcessPoolExecutor
+
+import pygments
+from docutils import nodes
+from sphinx.highlighting import PygmentsBridge
+from sphinx.util import logging
+
+from _cache import (
+	add_cache_config,
+	cache_dir,
+	digest,
+	load,
+	store,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Highlighted code is keyed by everything the Pygments output depends on
+# and pickled in the shared cache directory, so it survives `-E` builds
+# and is reused across articles
+_highlight_block = PygmentsBridge.highlight_block
+
+_app = None
+_highlighted: dict[str, str] = {}
+
+
+def highlight_key(
+	bridge: PygmentsBridge,
+	source: str,
+	lang: str,
+	opts: dict,
+	force: bool,
+	kwargs: dict,
+) -> str:
+	style = bridge.formatter_args['style']
+	return digest(
+		pygments.__version__,
+		bridge.dest,
+		str(bridge.latex_engine),
+		f"{style.__module__}.{style.__qualname__}",
+		lang,
+		repr(sorted((opts or {}).items())),
+		repr(force),
+		repr(sorted(kwargs.items())),
+		source,
+	)
+
+
+def _cache_file(key: str):
+	return cache_dir(_app, 'highlight') / key[:2] / f"{key}.hl"
+
+
+def cached_highlight_block(
+	self: PygmentsBridge,
+	source: str,
+	lang: str,
+	opts: dict | None = None,
+	force: bool = False,
+	location=None,
+	**kwargs,
+) -> str:
+	if _app is None or not isinstance(source, str):
+		return _highlight_block(
+			self, source, lang, opts, force, location, **kwargs
+		)
+
+	key = highlight_key(self, source, lang, opts, force, kwargs)
+	if key in _highlighted:
+		return _highlighted[key]
+
+	cache_file = _cache_file(key)
+	highlighted = load(cache_file)
+	if highlighted is None:
+		highlighted = _highlight_block(
+			self, source, lang, opts, force, location, **kwargs
+		)
+		store(cache_file, highlighted)
+
+	_highlighted[key] = highlighted
+	return highlighted
+
+
+@cache
+def _worker_bridge(dest: str, style: str, latex_engine: str) -> PygmentsBridge:
+	return PygmentsBridge(dest, style, latex_engine=latex_engine)
+
+
+def _highlight_in_worker(bridge_args, source, lang, opts, force, kwargs):
+	return _highlight_block(
+		_worker_bridge(*bridge_args),
+		source,
+		lang,
+		opts,
+		force,
+		**kwargs,
+	)
+
+
+def highlight_requests(app, doctree):
+	'''Yields the ``highlight_block`` calls the LaTeX writer will make.'''
+
+	highlight_options = app.config.highlight_options
+
+	for node in doctree.findall(nodes.literal_block):
+		# Parsed literals are not highlighted
+		if node.rawsource != node.astext():
+			continue
+
+		lang = node.get('language', 'default')
+		kwargs = dict(node.get('highlight_args', {}))
+		kwargs.pop('force', None)
+		kwargs['linenos'] = node.get('linenos', False)
+		yield (
+			node.rawsource,
+			lang,
+			highlight_options.get(lang, {}),
+			node.get('force', False),
+			kwargs,
+		)
+
+	for node in doctree.findall(nodes.literal):
+		lang = node.get('language', None)
+		if 'code' in node['classes'] and lang:
+			yield (
+				node.astext(),
+				lang,
+				highlight_options.get(lang, {}),
+				False,
+				{'nowrap': True},
+			)
+
+
+def prehighlight(app, doctree, docname):
+	'''Highlights the cache misses of ``doctree`` in worker processes.'''
+
+	if app.builder.format != 'latex':
+		return
+
+	config = app.config
+	bridge_args = ('latex', config.pygments_style, config.latex_engine)
+	bridge = _worker_bridge(*bridge_args)
+
+	misses = {}
+	for source, lang, opts, force, kwargs in highlight_requests(app, doctree):
+		key = highlight_key(bridge, source, lang, opts, force, kwargs)
+		if key in _highlighted or key in misses:
+			continue
+
+		highlighted = load(_cache_file(key))
+		if highlighted is not None:
+			_highlighted[key] = highlighted
+		else:
+			misses[key] = (source, lang, opts, force, kwargs)
+
+	workers = config.highlight_cache_workers
+	if len(misses) < config.highlight_cache_min_parallel or workers <= 1:
+		return
+
+	logger.info("highlighting %d code blocks in parallel", len(misses))
+	with ProcessPoolExecutor(
+		max_workers=workers,
+		mp_context=multiprocessing.get_context('fork'),
+	) as executor:
+		futures = {
+			key: executor.submit(_highlight_in_worker, bridge_args, *request)
+			for key, request in misses.items()
+		}
+		for key, future in futures.items():
+			try:
+				highlighted = future.result()
+			except Exception:
+				# Highlighted again (with its warnings) by the writer
+				continue
+			_highlighted[key] = highlighted
+			store(_cache_file(key), highlighted)
+
+
+def setup(app):
+	global _app
+	_app = app
+
+	add_cache_config(app)
+	app.add_config_value(
+		'highlight_cache_workers',
+		multiprocessing.cpu_count(),
+		'',
+	)
+	app.add_config_value('highlight_cache_min_parallel', 16, '')
+
+	PygmentsBridge.highlight_block = cached_highlight_block
+	# The LaTeX builder resolves the assembled document just before writing
+	app.connect('doctree-resolved', prehighlight)
+
+	return {
+		'version': '0.1',
+		'parallel_read_safe': True,
+		'parallel_write_safe': True,
+	}
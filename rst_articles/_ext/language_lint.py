@@ -0,0 +1,236 @@
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from docutils import nodes
+from sphinx import addnodes
+from sphinx.util import logging
+
+from _cache import (
+	add_cache_config,
+	cache_dir,
+	digest,
+	load,
+	store,
+)
+
+try:
+	from language_tool_python import LanguageTool
+	from rst_articles.linter.extractor.rst import extract_text
+	from rst_articles.linter.linter import draft_disabled_categories
+except ImportError:
+	LanguageTool = None
+
+
+logger = logging.getLogger(__name__)
+
+# Code, markup, math, citation keys and cross-reference targets are not
+# prose
+SKIPPED_NODES = (
+	addnodes.pending_xref,
+	nodes.citation_reference,
+	nodes.literal_block,
+	nodes.doctest_block,
+	nodes.comment,
+	nodes.raw,
+	nodes.math,
+	nodes.math_block,
+	nodes.target,
+)
+
+
+class LanguageLinter:
+	'''Checks the prose of every document read, while the build goes on.
+
+	Documents are submitted on ``doctree-read``, so only the documents
+	Sphinx re-reads are checked, and the findings are reported as
+	warnings once the build finishes. The matches of a text are cached,
+	so unchanged documents do not reach LanguageTool on ``-E`` builds.
+	'''
+
+	def __init__(self, app):
+		self.app = app
+		config = app.config
+		self.language = config.language_lint_language
+		self.executor = ThreadPoolExecutor(
+			max_workers=config.language_lint_workers,
+		)
+		self.pending = {}
+		self.dictionary = set()
+		self._tool = None
+		self._tool_error = None
+		self._tool_lock = threading.Lock()
+
+		dictionary_file = Path(app.srcdir) / config.language_lint_dictionary
+		if dictionary_file.is_file():
+			self.dictionary.update(filter(bool, (
+				word.strip().lower()
+				for word in dictionary_file.read_text().split('\n')
+			)))
+
+	def get_tool(self) -> LanguageTool:
+		# Started by the first cache miss, while the main thread keeps reading
+		with self._tool_lock:
+			# A tool that failed to start fails every document at once
+			if self._tool_error is not None:
+				raise self._tool_error
+
+			if self._tool is None:
+				try:
+					self._tool = LanguageTool(
+						self.language,
+						remote_server=self.app.config.language_lint_server or None,
+					)
+				except Exception as e:
+					self._tool_error = e
+					raise
+
+				self._tool.enabled_categories = set(self.enabled_categories)
+				self._tool.disabled_categories = self.disabled_categories
+			return self._tool
+
+	@property
+	def enabled_categories(self) -> list[str]:
+		return sorted(self.app.config.language_lint_enabled_categories)
+
+	@property
+	def disabled_categories(self) -> set[str]:
+		# Same rules as RSTLinter._apply_rules
+		config = self.app.config
+		disabled = set(config.language_lint_disabled_categories)
+		if config.language_lint_draft:
+			disabled |= draft_disabled_categories - set(self.enabled_categories)
+		return disabled
+
+	def submit(self, docname: str, doctree: nodes.document):
+		try:
+			source = Path(self.app.env.doc2path(docname)).read_text()
+		except OSError:
+			source = None
+
+		text, offsets = extract_text(doctree, source, skip=SKIPPED_NODES)
+		self.pending[docname] = self.executor.submit(self.check, text, offsets)
+
+	def check(self, text: str, offsets) -> list[tuple]:
+		# Matches are cached by text offset and located afterwards, as the
+		# same text can come from sources with other skipped lines
+		key = digest(
+			'offsets',
+			self.language,
+			repr(self.enabled_categories),
+			repr(sorted(self.disabled_categories)),
+			text,
+		)
+		cache_file = cache_dir(self.app, 'language_lint') / f"{key}.matches"
+
+		matches = load(cache_file)
+		if matches is None:
+			matches = []
+			for match in self.get_tool().check(text):
+				error = match.context[
+					match.offset_in_context:
+					match.offset_in_context + match.error_length
+				]
+				matches.append(
+					(match.offset, match.message, error, match.replacements[:3])
+				)
+
+			store(cache_file, matches)
+
+		return [
+			((offsets.locate(offset) or (None, None))[0], *match)
+			for offset, *match in matches
+		]
+
+	def report(self):
+		for docname, future in sorted(self.pending.items()):
+			try:
+				matches = future.result()
+			except Exception as e:
+				logger.warning(
+					"language lint of %s failed: %s", docname, e,
+					type='language', subtype='lint',
+				)
+				continue
+
+			for line, message, error, replacements in matches:
+				if error.strip().lower() in self.dictionary:
+					continue
+
+				logger.warning(
+					"%s in \"%s\" (suggestions: %s)",
+					message,
+					error,
+					' | '.join(replacements) or '-',
+					location=(docname, line),
+					type='language',
+					subtype='lint',
+				)
+
+		self.pending.clear()
+
+	def close(self):
+		self.executor.shutdown(wait=True, cancel_futures=True)
+		if self._tool is not None:
+			self._tool.close()
+
+
+def builder_inited(app):
+	if not app.config.language_lint:
+		return
+
+	if LanguageTool is None:
+		logger.warning(
+			"language_lint needs language_tool_python and rst_articles",
+			type='language', subtype='lint',
+		)
+		return
+
+	app.language_linter = LanguageLinter(app)
+
+
+def doctree_read(app, doctree):
+	linter = getattr(app, 'language_linter', None)
+	if linter is not None:
+		linter.submit(app.env.docname, doctree)
+
+
+def build_finished(app, exception):
+	linter = getattr(app, 'language_linter', None)
+	if linter is None:
+		return
+
+	try:
+		if exception is None:
+			linter.report()
+	finally:
+		linter.close()
+		app.language_linter = None
+
+
+def setup(app):
+	add_cache_config(app)
+
+	app.add_config_value('language_lint', False, '')
+	app.add_config_value('language_lint_language', 'en-US', '')
+	app.add_config_value('language_lint_workers', 4, '')
+	app.add_config_value('language_lint_server', '', '')
+	app.add_config_value('language_lint_enabled_categories', [], '')
+	app.add_config_value('language_lint_disabled_categories', [], '')
+	app.add_config_value('language_lint_draft', False, '')
+	app.add_config_value(
+		'language_lint_dictionary',
+		'custom_dictionary.txt',
+		'',
+	)
+
+	app.connect('builder-inited', builder_inited)
+	app.connect('doctree-read', doctree_read)
+	app.connect('build-finished', build_finished)
+
+	return {
+		'version': '0.1',
+		# Documents read in worker processes would never be reported
+		'parallel_read_safe': False,
+		'parallel_write_safe': True,
+	}
@@ -0,0 +1,36 @@
+from sphinx import addnodes
+from sphinx.writers.latex import LaTeXTranslator
+
+
+UNIT_BEGIN = '%% rst-articles unit begin: '
+UNIT_END = '%% rst-articles unit end: '
+
+
+def visit_start_of_file_latex(self: LaTeXTranslator, node):
+	'''Marks where each top-level toctree document starts in the output.'''
+
+	# The root document is always at the bottom of the stack
+	if self.config.latex_unit_markers and len(self.curfilestack) == 1:
+		self.body.append(f'\n{UNIT_BEGIN}{node["docname"]}\n')
+	LaTeXTranslator.visit_start_of_file(self, node)
+
+
+def depart_start_of_file_latex(self: LaTeXTranslator, node):
+	LaTeXTranslator.depart_start_of_file(self, node)
+	if self.config.latex_unit_markers and len(self.curfilestack) == 1:
+		self.body.append(f'\n{UNIT_END}{node["docname"]}\n')
+
+
+def setup(app):
+	app.add_config_value('latex_unit_markers', False, '')
+	app.add_node(
+		addnodes.start_of_file,
+		override=True,
+		latex=(visit_start_of_file_latex, depart_start_of_file_latex),
+	)
+
+	return {
+		'version': '0.1',
+		'parallel_read_safe': True,
+		'parallel_write_safe': True,
+	}
@@ -0,0 +1,262 @@
+import json
+import time
+import cProfile
+from pathlib import Path
+from functools import wraps
+from collections import defaultdict
+
+from docutils.parsers.rst import directives
+from sphinx.events import EventListener
+from sphinx.transforms.post_transforms import SphinxPostTransform
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_DOCNAME = '<global>'
+
+
+class BuildProfiler:
+	'''Times event handlers, transforms, directives and LaTeX visitors.
+
+	Every call is accounted to the module that defines the callable (its
+	extension) and to the document being read or written at the time.
+	Times are inclusive, so a transform that emits an event also counts
+	the handlers of that event.
+	'''
+
+	def __init__(self, app):
+		self.app = app
+		# (extension, kind, name, docname) -> [calls, seconds]
+		self.stats = defaultdict(lambda: [0, 0.0])
+		self._patched = []
+		self._handlers = []
+		self._cprofile = None
+
+	def current_docname(self, translator=None) -> str:
+		if translator is not None and getattr(translator, 'curfilestack', None):
+			return translator.curfilestack[-1] or GLOBAL_DOCNAME
+
+		try:
+			return self.app.env.docname or GLOBAL_DOCNAME
+		except (AttributeError, KeyError):
+			return GLOBAL_DOCNAME
+
+	def record(self, extension, kind, name, docname, elapsed):
+		entry = self.stats[(extension, kind, name, docname)]
+		entry[0] += 1
+		entry[1] += elapsed
+
+	def _patch(self, owner, attribute, wrapper):
+		original = getattr(owner, attribute)
+		if getattr(original, '__profiled__', False):
+			return
+
+		wrapped = wraps(original)(wrapper(original))
+		wrapped.__profiled__ = True
+		self._patched.append((owner, attribute, original))
+		setattr(owner, attribute, wrapped)
+
+	def _timed_method(self, kind):
+		profiler = self
+
+		def wrapper(original):
+			def timed(self, *args, **kwargs):
+				start = time.perf_counter()
+				try:
+					return original(self, *args, **kwargs)
+				finally:
+					profiler.record(
+						type(self).__module__,
+						kind,
+						type(self).__name__,
+						profiler.current_docname(),
+						time.perf_counter() - start,
+					)
+			return timed
+		return wrapper
+
+	def _timed_visitor(self, name):
+		profiler = self
+
+		def wrapper(original):
+			def timed(translator, node):
+				start = time.perf_counter()
+				try:
+					return original(translator, node)
+				finally:
+					profiler.record(
+						original.__module__,
+						'visitor',
+						name,
+						profiler.current_docname(translator),
+						time.perf_counter() - start,
+					)
+			return timed
+		return wrapper
+
+	def _timed_handler(self, event, handler):
+		profiler = self
+
+		@wraps(handler)
+		def timed(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				return handler(*args, **kwargs)
+			finally:
+				profiler.record(
+					getattr(handler, '__module__', None) or '?',
+					'event',
+					f"{event}:{getattr(handler, '__qualname__', handler)}",
+					profiler.current_docname(),
+					time.perf_counter() - start,
+				)
+		timed.__profiled__ = True
+		return timed
+
+	def instrument(self):
+		registry = self.app.registry
+
+		for event, listeners in self.app.events.listeners.items():
+			listeners[:] = [
+				listener
+				if (
+					getattr(listener.handler, '__profiled__', False) or  # noqa: W504
+					getattr(listener.handler, '__module__', None) == __name__
+				)
+				else EventListener(
+					listener.id,
+					self._timed_handler(event, listener.handler),
+					listener.priority,
+				)
+				for listener in listeners
+			]
+
+		for transform in (
+			*registry.get_transforms(),
+			*registry.get_post_transforms(),
+		):
+			if 'apply' in vars(transform):
+				self._patch(transform, 'apply', self._timed_method('transform'))
+			# Post transforms implement run(), called by the inherited apply()
+			elif (
+				issubclass(transform, SphinxPostTransform) and  # noqa: W504
+				'run' in vars(transform)
+			):
+				self._patch(transform, 'run', self._timed_method('transform'))
+
+		for directive in list(directives._directives.values()):
+			if isinstance(directive, type) and 'run' in vars(directive):
+				self._patch(directive, 'run', self._timed_method('directive'))
+
+		for handlers in registry.translation_handlers.values():
+			for node_name, (visit, depart) in list(handlers.items()):
+				self._handlers.append((handlers, node_name, (visit, depart)))
+				handlers[node_name] = (
+					wraps(visit)(self._timed_visitor(f"visit_{node_name}")(visit)),
+					depart and wraps(depart)(
+						self._timed_visitor(f"depart_{node_name}")(depart)
+					),
+				)
+
+		if self.app.config.profile_cprofile:
+			self._cprofile = cProfile.Profile()
+			self._cprofile.enable()
+
+	def restore(self):
+		for owner, attribute, original in reversed(self._patched):
+			setattr(owner, attribute, original)
+		self._patched.clear()
+
+		for handlers, node_name, pair in self._handlers:
+			handlers[node_name] = pair
+		self._handlers.clear()
+
+	def report(self, outdir: Path):
+		if self._cprofile is not None:
+			self._cprofile.disable()
+			self._cprofile.dump_stats(outdir / 'profile.prof')
+
+		rows = sorted(
+			(
+				(extension, kind, name, docname, calls, seconds)
+				for (extension, kind, name, docname), (calls, seconds)
+				in self.stats.items()
+			),
+			key=lambda row: row[-1],
+			reverse=True,
+		)
+
+		per_extension = defaultdict(float)
+		per_document = defaultdict(float)
+		for extension, kind, name, docname, calls, seconds in rows:
+			per_extension[extension] += seconds
+			per_document[docname] += seconds
+
+		(outdir / 'profile.json').write_text(json.dumps({
+			'per_extension': per_extension,
+			'per_document': per_document,
+			'calls': [
+				dict(zip(
+					('extension', 'kind', 'name', 'docname', 'calls', 'seconds'),
+					row,
+				))
+				for row in rows
+			],
+		}, indent=2))
+
+		lines = ["# Per extension #"]
+		lines.extend(
+			f"{seconds:10.4f}s  {extension}"
+			for extension, seconds in sorted(
+				per_extension.items(), key=lambda item: item[1], reverse=True
+			)
+		)
+		lines.append("\n# Per document #")
+		lines.extend(
+			f"{seconds:10.4f}s  {docname}"
+			for docname, seconds in sorted(
+				per_document.items(), key=lambda item: item[1], reverse=True
+			)
+		)
+		lines.append("\n# Calls #")
+		lines.extend(
+			f"{seconds:10.4f}s {calls:6d}x  {extension} {kind} {name} [{docname}]"
+			for extension, kind, name, docname, calls, seconds in rows
+		)
+		(outdir / 'profile.txt').write_text("\n".join(lines) + "\n")
+
+		logger.info("extension profile written to %s", outdir / 'profile.txt')
+
+
+def builder_inited(app):
+	if not app.config.profile_extensions:
+		return
+
+	app.profiler = BuildProfiler(app)
+	app.profiler.instrument()
+
+
+def build_finished(app, exception):
+	profiler = getattr(app, 'profiler', None)
+	if profiler is None:
+		return
+
+	profiler.restore()
+	if exception is None:
+		profiler.report(Path(app.outdir))
+
+
+def setup(app):
+	app.add_config_value('profile_extensions', False, '')
+	app.add_config_value('profile_cprofile', False, '')
+
+	# Runs first so every other handler is already registered when wrapping
+	app.connect('builder-inited', builder_inited, priority=0)
+	app.connect('build-finished', build_finished, priority=1000)
+
+	return {
+		'version': '0.1',
+		'parallel_read_safe': True,
+		'parallel_write_safe': True,
+	}
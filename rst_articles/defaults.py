@@ -1,6 +1,12 @@
+import os
 from pathlib import Path
 
 
+default_cache_dir = Path(os.environ.get(
+	'RST_ARTICLES_CACHE_DIR',
+	Path.home() / '.cache' / 'rst_articles',
+))
+
 external_extensions = {
 	'sphinxcontrib.bibtex',
 }
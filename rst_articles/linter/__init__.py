@@ -1,5 +1,7 @@
 from .linter import RSTLinter
+from .quick import QuickLinter
 
 __all__ = [
 	'RSTLinter',
+	'QuickLinter',
 ]
@@ -1,37 +1,98 @@
-import re
+from typing import Optional
+from bisect import bisect_right
+from dataclasses import dataclass, field
 
 from docutils import nodes
 from docutils.core import publish_doctree
 
 
-inline_rst_call = re.compile(r'([ \t]+)?(?:\s*:[a-z]+:`[^`]+`)+([ \t]+)?')
-ends_s = re.compile(r'.*?\s$', re.MULTILINE | re.DOTALL)
-starts_s = re.compile(r'^\s.*', re.MULTILINE | re.DOTALL)
+max_needle_length = 40
+
+
+@dataclass
+class OffsetMap:
+	'''Maps offsets in the extracted text back to the rST source.'''
+
+	text_offsets: list[int] = field(default_factory=list)
+	source_offsets: list[int] = field(default_factory=list)
+	fragment_lengths: list[int] = field(default_factory=list)
+	line_starts: list[int] = field(default_factory=lambda: [0])
+
+	@classmethod
+	def for_source(cls, source: str) -> 'OffsetMap':
+		offsets = cls()
+
+		line_end = source.find('\n')
+		while line_end >= 0:
+			offsets.line_starts.append(line_end + 1)
+			line_end = source.find('\n', line_end + 1)
+
+		return offsets
+
+	def add(self, text_offset: int, source_offset: int, length: int):
+		self.text_offsets.append(text_offset)
+		self.source_offsets.append(source_offset)
+		self.fragment_lengths.append(length)
+
+	def source_offset(self, text_offset: int) -> Optional[int]:
+		index = bisect_right(self.text_offsets, text_offset) - 1
+		if index < 0:
+			return None
+
+		delta = min(
+			text_offset - self.text_offsets[index],
+			self.fragment_lengths[index],
+		)
+		return self.source_offsets[index] + delta
+
+	def locate(self, text_offset: int) -> Optional[tuple[int, int]]:
+		'''Returns the 1-based (line, column) of a text offset.'''
+
+		source_offset = self.source_offset(text_offset)
+		if source_offset is None:
+			return None
+
+		line = bisect_right(self.line_starts, source_offset)
+		return line, source_offset - self.line_starts[line - 1] + 1
 
 
 class PlainTextExtractor(nodes.NodeVisitor):
-	def __init__(self, document):
+	def __init__(self, document, skip: tuple[type, ...] = ()):
 		super().__init__(document)
+		# (text, source line) pairs in document order
 		self.found_text = []
+		self._lines = [None]
+		self._skip = skip
+
+	def dispatch_visit(self, node):
+		if isinstance(node, self._skip):
+			raise nodes.SkipNode
+		if isinstance(node, nodes.Element):
+			self._lines.append(node.line or self._lines[-1])
+		return super().dispatch_visit(node)
+
+	def dispatch_departure(self, node):
+		if isinstance(node, nodes.Element):
+			self._lines.pop()
+		return super().dispatch_departure(node)
+
+	def visit_system_message(self, node):
+		self._lines.pop()
+		raise nodes.SkipNode
+
+	def visit_problematic(self, node):
+		# Unknown roles (:abbrev:, :fcite:, ...) outside of Sphinx
+		if node.rawsource.startswith(':'):
+			self._lines.pop()
+			raise nodes.SkipNode
 
 	def visit_Text(self, node):
-		current = node
-		while current:
-			if isinstance(current, nodes.system_message):
-				return
-			current = current.parent
-
-		clean_text = inline_rst_call.sub(
-			lambda match: ' ' if match.group(1) or match.group(2) else '',
-			node.astext()
-		)
+		text = node.astext()
 
-		if not clean_text.strip(' \n.'):
+		if not text.strip(' \n.'):
 			return
 
-		self.found_text.append(clean_text)
-		# print(node.astext())
-		# print('->', self.found_text[-1], '\n---')
+		self.found_text.append((text, self._lines[-1]))
 
 	def depart_Text(self, node):
 		pass
@@ -43,8 +104,68 @@ class PlainTextExtractor(nodes.NodeVisitor):
 		pass
 
 
-def rst_to_text(rst_content: str) -> str:
-	doctree = publish_doctree(
+def _join(found_text, source: Optional[str]) -> tuple[str, OffsetMap]:
+	offsets = OffsetMap.for_source(source or '')
+
+	clean_text = []
+	text_offset = 0
+	cursor = 0
+	prev_ends = False
+
+	for text, line in found_text:
+		curr_starts = text[:1].isspace()
+
+		if prev_ends and curr_starts:
+			text = text[1:]
+		elif not (prev_ends or curr_starts) and clean_text:
+			clean_text.append(' ')
+			text_offset += 1
+
+		if source is not None:
+			# Search forward from the node line (titles report their
+			# underline), never going back before the previous match.
+			# Each line is located on its own so indentation does not drift
+			start = cursor
+			if line is not None:
+				line_index = max(min(line, len(offsets.line_starts)) - 2, 0)
+				start = max(start, offsets.line_starts[line_index])
+
+			piece_offset = text_offset
+			for piece in text.split('\n'):
+				stripped = piece.lstrip()
+				needle = stripped[:max_needle_length]
+				found = source.find(needle, start) if needle else -1
+
+				if found >= 0:
+					source_offset = found - (len(piece) - len(stripped))
+					start = cursor = found + len(needle)
+				else:
+					source_offset = start
+
+				offsets.add(piece_offset, max(source_offset, 0), len(piece))
+				piece_offset += len(piece) + 1
+
+		clean_text.append(text)
+		text_offset += len(text)
+		prev_ends = text[-1:].isspace()
+
+	return "".join(clean_text), offsets
+
+
+def extract_text(
+	doctree: nodes.document,
+	source: Optional[str] = None,
+	*,
+	skip: tuple[type, ...] = (),
+) -> tuple[str, OffsetMap]:
+	visitor = PlainTextExtractor(doctree, skip)
+	doctree.walkabout(visitor)
+
+	return _join(visitor.found_text, source)
+
+
+def publish_rst(rst_content: str) -> nodes.document:
+	return publish_doctree(
 		rst_content,
 		settings_overrides={
 			'report_level': 5,
@@ -53,24 +174,10 @@ def rst_to_text(rst_content: str) -> str:
 		}
 	)
 
-	visitor = PlainTextExtractor(doctree)
-	doctree.walkabout(visitor)
-
-	found_text = visitor.found_text
 
-	if not found_text:
-		return ""
+def rst_to_text_with_offsets(rst_content: str) -> tuple[str, OffsetMap]:
+	return extract_text(publish_rst(rst_content), rst_content)
 
-	clean_text = [str(found_text[0])]
-	for text in map(str, found_text[1:]):
-		prev_ends = ends_s.match(clean_text[-1])
-		curr_starts = starts_s.match(text)
 
-		if prev_ends and curr_starts:
-			clean_text.append(text[1:])
-		elif not (prev_ends or curr_starts):
-			clean_text.append(f" {text}")
-		else:
-			clean_text.append(text)
-
-	return "".join(clean_text)
+def rst_to_text(rst_content: str) -> str:
+	return extract_text(publish_rst(rst_content))[0]
@@ -1,13 +1,31 @@
-from typing import Optional
+from typing import Iterable, Optional
 from pathlib import Path
 from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
-from language_tool_python import LanguageTool
+try:
+	from language_tool_python import LanguageTool
+except ImportError:
+	LanguageTool = None
 
-from doc8 import doc8
+try:
+	from doc8 import doc8
+except ImportError:
+	doc8 = None
 
 
-from .extractor.rst import rst_to_text
+from .extractor.rst import OffsetMap, rst_to_text_with_offsets
+from .quick import QuickLinter
+
+
+draft_disabled_categories = frozenset({
+	'STYLE',
+	'TYPOGRAPHY',
+	'REDUNDANCY',
+	'PLAIN_ENGLISH',
+	'CASING',
+})
 
 
 @dataclass
@@ -16,58 +34,242 @@ class RSTLinter:
 
 	syntax_errors: list = field(default_factory=list)
 	language_errors: list = field(default_factory=list)
+	# file -> (syntax errors, language errors), filled by lint_many
+	file_errors: dict[str, tuple[list, list]] = field(default_factory=dict)
+	max_workers: int = field(default=8)
 
 	custom_dictionary: set[str] = field(default_factory=set)
 
+	enabled_categories: set[str] = field(default_factory=set)
+	disabled_categories: set[str] = field(default_factory=set)
+	enabled_rules: set[str] = field(default_factory=set)
+	disabled_rules: set[str] = field(default_factory=set)
+	draft: bool = field(default=False)
+
+	# Started on the first full check, a shared tool keeps its server (and
+	# its spellings) across linters
 	tool: Optional[LanguageTool] = field(default=None)
+	quick: QuickLinter = field(default_factory=QuickLinter)
+
+	_tool_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
 
 	def __post_init__(self):
-		self.tool = LanguageTool(self.language)
+		self.configure_rules()
 
-	def lint_syntax(self, file_path: Path | str):
-		self.syntax_errors.clear()
+	@staticmethod
+	def available(*, quick: bool = False) -> bool:
+		'''Whether the linter dependencies are installed.
+
+		The quick tier only needs doc8, the full one LanguageTool as well.
+		'''
+		return doc8 is not None and (quick or LanguageTool is not None)
+
+	def get_tool(self) -> LanguageTool:
+		with self._tool_lock:
+			if self.tool is None:
+				if LanguageTool is None:
+					raise ImportError(
+						"language_tool_python is required for the full language check"
+					)
+
+				# Words known at startup are handed to the server as spellings, so
+				# LanguageTool does not report (nor compute replacements for) them
+				self.tool = LanguageTool(
+					self.language,
+					new_spellings=sorted(self.custom_dictionary) or None,
+					new_spellings_persist=False,
+				)
+				self._apply_rules()
+
+		return self.tool
+
+	def configure_rules(
+		self,
+		*,
+		enabled_categories: Optional[set[str]] = None,
+		disabled_categories: Optional[set[str]] = None,
+		enabled_rules: Optional[set[str]] = None,
+		disabled_rules: Optional[set[str]] = None,
+		draft: Optional[bool] = None,
+	):
+		if enabled_categories is not None:
+			self.enabled_categories = set(enabled_categories)
+		if disabled_categories is not None:
+			self.disabled_categories = set(disabled_categories)
+		if enabled_rules is not None:
+			self.enabled_rules = set(enabled_rules)
+		if disabled_rules is not None:
+			self.disabled_rules = set(disabled_rules)
+		if draft is not None:
+			self.draft = draft
 
-		if isinstance(file_path, Path):
-			file_path = str(file_path)
+		if self.tool is not None:
+			self._apply_rules()
 
-		syntax_result = doc8(paths=[file_path])
+	def _apply_rules(self):
+		disabled = set(self.disabled_categories)
+		if self.draft:
+			disabled |= draft_disabled_categories - self.enabled_categories
+
+		self.tool.enabled_categories = set(self.enabled_categories)
+		self.tool.disabled_categories = disabled
+		self.tool.enabled_rules = set(self.enabled_rules)
+		self.tool.disabled_rules = set(self.disabled_rules)
+
+	def check_syntax(
+		self,
+		file_paths: Iterable[Path | str],
+	) -> dict[str, list]:
+		file_paths = list(map(str, file_paths))
+		errors = {file_path: [] for file_path in file_paths}
+
+		if not file_paths:
+			return errors
+
+		if doc8 is None:
+			raise ImportError("doc8 is required to check the syntax")
+
+		syntax_result = doc8(paths=file_paths)
 		if syntax_result.total_errors:
 			for error, file, line, code, desc in syntax_result.errors:
-				self.syntax_errors.append((line, desc))
+				errors.setdefault(file, []).append((line, desc))
+
+		return errors
+
+	# Results are rebound rather than updated in place, so a reader on
+	# another thread never sees a half-filled list
+	def lint_syntax(self, file_path: Path | str):
+		self.syntax_errors = [
+			error
+			for errors in self.check_syntax([file_path]).values()
+			for error in errors
+		]
+
+	def check_language(
+		self,
+		content: str,
+		*,
+		content_extension: str = ".rst",
+		full: bool = True,
+	) -> list:
+		'''Checks the language of ``content``.
 
-	def lint_language(self, content: str, *, content_extension: str = ".rst"):
-		self.language_errors.clear()
+		The full check asks LanguageTool, the quick one only runs the
+		in-process ``QuickLinter``.
+		'''
 
 		if content_extension == ".rst":
-			clean_text = rst_to_text(content)
+			clean_text, offsets = rst_to_text_with_offsets(content)
 		else:
 			clean_text = content
+			offsets = OffsetMap.for_source(content)
+			offsets.add(0, 0, len(content))
 
-		matches = self.tool.check(clean_text)
-
-		if matches:
-			for error in matches:
-				actual_error = error.context[
-					error.offset_in_context:
-					error.offset_in_context + error.error_length
-				]
-
-				if actual_error.strip().lower() not in self.custom_dictionary:
-					self.language_errors.append((
-						actual_error,
-						error.message,
-						error.context,
-						error.replacements,
-					))
-
-	def print_syntax_errors(self):
-		for line, desc in self.syntax_errors:
+		if not full:
+			return self.quick.check(
+				clean_text,
+				offsets,
+				known_words=self.custom_dictionary,
+			)
+
+		errors = []
+		for error in self.get_tool().check(clean_text):
+			actual_error = error.context[
+				error.offset_in_context:
+				error.offset_in_context + error.error_length
+			]
+
+			# Only words added after the server started still need this
+			if actual_error.strip().lower() not in self.custom_dictionary:
+				line, column = offsets.locate(error.offset) or (None, None)
+				errors.append((
+					actual_error,
+					error.message,
+					error.context,
+					error.replacements,
+					line,
+					column,
+				))
+
+		return errors
+
+	def lint_language(
+		self,
+		content: str,
+		*,
+		content_extension: str = ".rst",
+		full: bool = True,
+	):
+		self.language_errors = self.check_language(
+			content,
+			content_extension=content_extension,
+			full=full,
+		)
+
+	def lint_many(
+		self,
+		contents: dict[Path | str, str],
+		*,
+		syntax_paths: Iterable[Path | str] = (),
+		full: bool = True,
+	) -> dict[str, tuple[list, list]]:
+		'''Checks the language of every file concurrently.
+
+		Syntax is checked with a single doc8 pass over ``syntax_paths``,
+		which must already exist on disk.
+		'''
+
+		file_errors = {}
+
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			language_futures = {
+				str(file): executor.submit(
+					self.check_language,
+					content,
+					content_extension=Path(file).suffix,
+					full=full,
+				)
+				for file, content in contents.items()
+			}
+			syntax_errors = self.check_syntax(syntax_paths)
+
+			for file, future in language_futures.items():
+				file_errors[file] = ([], future.result())
+
+		for file, errors in syntax_errors.items():
+			file_errors.setdefault(file, ([], []))[0].extend(errors)
+
+		self.file_errors = file_errors
+		self.syntax_errors = [
+			error
+			for file_syntax_errors, _ in file_errors.values()
+			for error in file_syntax_errors
+		]
+		self.language_errors = [
+			error
+			for _, file_language_errors in file_errors.values()
+			for error in file_language_errors
+		]
+
+		return file_errors
+
+	def print_syntax_errors(self, errors: Optional[list] = None):
+		if errors is None:
+			errors = self.syntax_errors
+
+		for line, desc in errors:
 			print(line, '|', desc)
 
-	def print_language_errors(self):
-		for actual_error, msg, context, suggestions in self.language_errors:
+	def print_language_errors(self, errors: Optional[list] = None):
+		if errors is None:
+			errors = self.language_errors
+
+		for (
+			actual_error, msg, context, suggestions, line, column
+		) in errors:
+			location = f"{line}:{column} | " if line is not None else ""
 			print(
-				f"{msg} in \"{actual_error}\":\n\t{context}\n\t"
+				f"{location}{msg} in \"{actual_error}\":\n\t{context}\n\t"
 				f"Suggestions: {' | '.join(suggestions[:3])}"
 			)
 
@@ -85,3 +287,20 @@ class RSTLinter:
 			self.print_language_errors()
 		elif print_info:
 			print("+ No language errors")
+
+	def print_file_errors(self, *, print_info: bool = True):
+		for file, (syntax_errors, language_errors) in self.file_errors.items():
+			if not (syntax_errors or language_errors):
+				if print_info:
+					print(f"+ {file}: no errors")
+				continue
+
+			print(f"## {file} ##")
+			if syntax_errors:
+				if print_info:
+					print("# Syntax errors #")
+				self.print_syntax_errors(syntax_errors)
+			if language_errors:
+				if print_info:
+					print("# Language errors #")
+				self.print_language_errors(language_errors)
@@ -0,0 +1,178 @@
+from typing import Iterable
+from pathlib import Path
+from dataclasses import dataclass, field
+from functools import cache
+import warnings
+import re
+
+from .extractor.rst import OffsetMap
+
+
+# Plain word lists (the wamerican/words packages) or Hunspell dictionaries
+# (hunspell-en-us), whose affix flags are ignored
+default_word_lists = (
+	Path('/usr/share/dict/words'),
+	Path('/usr/dict/words'),
+	Path('/usr/share/hunspell/en_US.dic'),
+	Path('/usr/share/myspell/en_US.dic'),
+	Path('/usr/share/myspell/dicts/en_US.dic'),
+)
+
+# The word of a Hunspell line, before its affix flags and morphology
+dictionary_word_pattern = re.compile(r'[/\s]')
+word_pattern = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+repeated_word_pattern = re.compile(r"\b([^\W\d_]+)(\s+)(\1)\b", re.IGNORECASE)
+double_space_pattern = re.compile(r"(?<=\S)( {2,})(?=\S)")
+
+# (suffix, replacement) pairs tried on unknown words
+suffixes = (
+	("'s", ''), ("’s", ''),
+	('ies', 'y'), ('ied', 'y'), ('ier', 'y'), ('iest', 'y'), ('ily', 'y'),
+	('es', ''), ('s', ''),
+	('ed', ''), ('ed', 'e'), ('ing', ''), ('ing', 'e'),
+	('er', ''), ('er', 'e'), ('est', ''), ('est', 'e'),
+	('ly', ''), ('ness', ''), ('ment', ''), ('able', ''), ('able', 'e'),
+)
+prefixes = (
+	'anti', 'co', 'de', 'dis', 'im', 'in', 'inter', 'mis', 'multi', 'non',
+	'over', 'pre', 're', 'semi', 'sub', 'super', 'un', 'under',
+)
+
+
+@cache
+def load_word_list(path: Path) -> frozenset[str]:
+	try:
+		with path.open(errors='replace') as file:
+			words = frozenset(
+				dictionary_word_pattern.split(line.strip(), maxsplit=1)[0].lower()
+				for line in file
+			)
+	except OSError:
+		return frozenset()
+
+	# Hunspell dictionaries start with their word count
+	return frozenset(
+		word
+		for word in words
+		if word and not word.isdigit()
+	)
+
+
+@cache
+def find_words(word_lists: tuple[Path, ...]) -> frozenset[str]:
+	'''Words of the first usable list, warns once if there is none.'''
+
+	for path in word_lists:
+		words = load_word_list(path)
+		if words:
+			return words
+
+	warnings.warn(
+		"No word list found, the quick linter does not check spelling. "
+		"Install one (e.g. the wamerican or hunspell-en-us package) or "
+		"pass QuickLinter(word_lists=...)",
+		RuntimeWarning,
+	)
+	return frozenset()
+
+
+def stems(word: str) -> Iterable[str]:
+	for suffix, replacement in suffixes:
+		if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+			stem = word[:-len(suffix)]
+			yield stem + replacement
+			# running -> run, stopped -> stop
+			if len(stem) > 2 and stem[-1] == stem[-2]:
+				yield stem[:-1]
+
+	for prefix in prefixes:
+		if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+			yield word[len(prefix):]
+
+
+@dataclass
+class QuickLinter:
+	'''In-process first linting tier, fast enough to run on every write.
+
+	Checks spelling against system word lists (with naive affix
+	stripping) and the custom dictionary, plus repeated words and doubled
+	spaces. Errors have the same shape as the LanguageTool ones.
+	Spelling is skipped, with a warning, when no word list is installed.
+	'''
+
+	word_lists: tuple[Path, ...] = field(default=default_word_lists)
+	min_word_length: int = field(default=3)
+	context_length: int = field(default=20)
+
+	@property
+	def words(self) -> frozenset[str]:
+		return find_words(tuple(self.word_lists))
+
+	def is_known(self, word: str, known_words: set[str]) -> bool:
+		word = word.lower()
+		words = self.words
+		if word in words or word in known_words:
+			return True
+
+		return any(
+			stem in words or stem in known_words
+			for stem in stems(word)
+		)
+
+	def _error(
+		self,
+		text: str,
+		offsets: OffsetMap,
+		start: int,
+		end: int,
+		message: str,
+		replacements: list[str],
+	) -> tuple:
+		context = text[
+			max(0, start - self.context_length):
+			end + self.context_length
+		].replace('\n', ' ')
+		line, column = offsets.locate(start) or (None, None)
+		return (text[start:end], message, context, replacements, line, column)
+
+	def check(
+		self,
+		text: str,
+		offsets: OffsetMap,
+		*,
+		known_words: set[str] = frozenset(),
+	) -> list:
+		errors = []
+
+		if self.words:
+			for match in word_pattern.finditer(text):
+				word = match[0]
+				if (
+					len(word) < self.min_word_length or  # noqa: W504
+					# Acronyms and code-like names
+					any(char.isupper() for char in word[1:])
+				):
+					continue
+
+				if not self.is_known(word, known_words):
+					errors.append(self._error(
+						text, offsets, match.start(), match.end(),
+						"Possible spelling mistake found.",
+						[],
+					))
+
+		for match in repeated_word_pattern.finditer(text):
+			errors.append(self._error(
+				text, offsets, match.start(), match.end(),
+				"Possible typo: you repeated a word.",
+				[match[1]],
+			))
+
+		for match in double_space_pattern.finditer(text):
+			errors.append(self._error(
+				text, offsets, match.start(1), match.end(1),
+				"Whitespace repetition (bad style).",
+				[' '],
+			))
+
+		return sorted(errors, key=lambda error: (error[4] or 0, error[5] or 0))
@@ -1,5 +1,7 @@
 from .article import Article
+from .variants import Variant
 
 __all__ = [
 	'Article',
+	'Variant',
 ]
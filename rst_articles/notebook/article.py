@@ -1,18 +1,65 @@
-from typing import Optional
+from typing import Callable, Optional
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from functools import partial
+from functools import partial, wraps
+import threading
+import tempfile
 import subprocess
+import filecmp
+import errno
 import shutil
+import os
+import re
 
 try:
-	from pdf2image import convert_from_path
-	from IPython.display import display
+	from IPython.display import Image, display
 except ImportError:
-	convert_from_path = None
+	Image = None
 	display = None
 
-from rst_articles.defaults import default_extensions
+from rst_articles.defaults import default_cache_dir, default_extensions
+from rst_articles.notebook.bibliography import (
+	cited_keys,
+	full_suffix,
+	prune_bibliography_file,
+)
+from rst_articles.notebook.build_cache import BuildCache
+from rst_articles.notebook.latex_units import split_units
+from rst_articles.notebook.project_index import ProjectIndex
+from rst_articles.notebook.pdf_optimizer import PDFOptimization, PDFOptimizer
+from rst_articles.notebook.pdf_render import (
+	PageViewer,
+	convert_from_path,
+	image_formats,
+	ipywidgets,
+	page_count,
+	render_page,
+)
+from rst_articles.notebook.state import (
+	RestoredState,
+	StateArchive,
+	file_digest,
+)
+from rst_articles.notebook.variants import (
+	Variant,
+	variant_env_var,
+	variants_dir_name,
+)
+from rst_articles.notebook.templating import (
+	Template,
+	latex_escape,
+	python_literal,
+	rst_text,
+)
+from rst_articles.notebook.workspace import MemoryWorkspace
+from rst_articles.notebook.runner import (
+	BuildMessage,
+	LaTeXLogParser,
+	SphinxLogParser,
+	run_streaming,
+	tail_file,
+)
 
 
 try:
@@ -24,6 +71,87 @@ except ImportError:
 pdir = Path(__file__).parents[1]
 _base_ext_path: Path = pdir / "_ext"
 
+bibliography_style_pattern = re.compile(r':style:\s*(\S+)')
+
+
+def link_or_copy(source: Path, target: Path):
+	target.parent.mkdir(parents=True, exist_ok=True)
+	try:
+		target.symlink_to(source.resolve())
+	except OSError:
+		shutil.copy2(source, target)
+
+
+# mkstemp creates private files, written sources get the usual mode
+_umask = os.umask(0)
+os.umask(_umask)
+new_file_mode = 0o666 & ~_umask
+
+# The files doc8 checks, the others are assets
+syntax_lint_suffixes = {'.rst', '.txt'}
+
+
+def has_content(file: Path, content: str) -> bool:
+	try:
+		return file.read_text() == content
+	except (OSError, UnicodeDecodeError):
+		return False
+
+
+def write_atomically(files: dict[Path, str]):
+	'''Writes every file or none of them.
+
+	Files already holding their content are left untouched, so their
+	modification time (which Sphinx and LaTeX compare) only changes with
+	their content.
+	'''
+
+	staged = []
+	try:
+		for file, content in files.items():
+			if has_content(file, content):
+				continue
+			file.parent.mkdir(parents=True, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=file.parent, prefix=f".{file.name}.")
+			staged.append((tmp, file))
+			with os.fdopen(fd, 'w') as tmp_file:
+				tmp_file.write(content)
+
+			try:
+				mode = file.stat().st_mode & 0o777
+			except FileNotFoundError:
+				mode = new_file_mode
+			os.chmod(tmp, mode)
+	except BaseException:
+		for tmp, _ in staged:
+			os.unlink(tmp)
+		raise
+
+	for tmp, file in staged:
+		os.replace(tmp, file)
+
+
+def report(output: Optional[list[str]], *values):
+	'''Prints ``values``, or collects the line in ``output`` if given.'''
+
+	if output is None:
+		print(*values)
+	else:
+		output.append(" ".join(str(value) for value in values))
+
+
+def cancellable(method):
+	'''Consumes a pending ``Article.cancel`` once the build returns.'''
+
+	@wraps(method)
+	def wrapper(self, *args, **kwargs):
+		try:
+			return method(self, *args, **kwargs)
+		finally:
+			self._cancelled.clear()
+
+	return wrapper
+
 
 @dataclass
 class Article:
@@ -31,25 +159,62 @@ class Article:
 	extensions: set[str] = field(default_factory=partial(set, default_extensions))
 	enable_linter: bool = field(default=True)
 	linter_lang: str = field(default='en-US')
+	linter_enabled_categories: set[str] = field(default_factory=set)
+	linter_disabled_categories: set[str] = field(default_factory=set)
+	linter_draft: bool = field(default=False)
+	# Lint writes with the in-process tier only, see lint()
+	quick_linting: bool = field(default=False)
+	# Lint the documents Sphinx reads during build(), see language_lint.py
+	sphinx_linting: bool = field(default=False)
 
 	source_dir: Path = field(default=Path('source'))
 	build_dir: Path = field(default=Path('build'))
+	cache_dir: Path = field(default=default_cache_dir)
+	build_cache: Optional[BuildCache] = field(default=None)
+	# Post-processes every complete PDF, see optimize_pdf()
+	pdf_optimizer: Optional[PDFOptimizer] = field(default=None)
+	# Compile each toctree entry as an \include'd unit, see build()
+	latex_units: bool = field(default=False)
+	# Build in a RAM-backed workspace of up to memory_limit bytes
+	memory_build: bool = field(default=False)
+	memory_limit: int = field(default=512 * 1024 ** 2)
 
 	linter: Optional[RSTLinter] = field(default=None)
 
 	_custom_dictionary: set[str] = field(default_factory=set)
+	# Files only checked by the quick tier since their last write
+	_pending_lint: set[Path] = field(default_factory=set)
 
-	_index_template: str = field(default=None)
-	_bibliography_template: str = field(default=None)
-	_definition_list_template: str = field(default=None)
-	_config_template: str = field(default=None)
-	_title_template: str = field(default=None)
-	_preamble_template: str = field(default=None)
+	# Sources of the last restored state, see restore_state()
+	_restored_sources: Optional[dict[str, list]] = field(default=None)
+
+	# Definitions, citations and labels of the sources, see write()
+	project_index: Optional[ProjectIndex] = field(default=None)
+	reference_checking: bool = field(default=True)
+
+	_index_template: Template = field(default=None)
+	_bibliography_template: Template = field(default=None)
+	_definition_list_template: Template = field(default=None)
+	_config_template: Template = field(default=None)
+	_title_template: Template = field(default=None)
+	_preamble_template: Template = field(default=None)
+	_preview_index_template: Template = field(default=None)
 
 	_ext_path: Path = Path('_ext')
 
 	sphinx_logs: str = field(default='')
 	latex_logs: str = field(default='')
+	build_messages: list[BuildMessage] = field(default_factory=list)
+
+	on_output: Optional[Callable[[str], None]] = field(default=None)
+	max_log_lines: int = field(default=2000)
+
+	# Guards the state read by other threads through snapshot()
+	_lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+	_cancelled: threading.Event = field(
+		default_factory=threading.Event,
+		repr=False,
+	)
 
 	def __post_init__(self):
 		self.set_abstract = partial(
@@ -58,47 +223,80 @@ class Article:
 			enable_syntax_linting=False,
 			enable_language_linting=True,
 		)
-		if self.enable_linter and RSTLinter is not None:
+		self.reload_templates()
+
+		self.source_dir.mkdir(parents=True, exist_ok=True)
+		if self.project_index is None:
+			self.project_index = ProjectIndex.scan(self.source_dir)
+
+		dictionary_file = self.source_dir / "custom_dictionary.txt"
+		if dictionary_file.exists():
+			self._custom_dictionary.update(filter(bool, (
+				word.strip().lower()
+				for word in dictionary_file.read_text().split('\n')
+			)))
+
+		if self.linter is not None:
+			# A given linter shares the dictionary of this article
+			self._custom_dictionary.update(self.linter.custom_dictionary)
+			self.linter.custom_dictionary = self._custom_dictionary
+		elif (
+			self.enable_linter and  # noqa: W504
+			RSTLinter is not None and  # noqa: W504
+			RSTLinter.available(quick=self.quick_linting)
+		):
 			self.linter = RSTLinter(
 				self.linter_lang,
 				custom_dictionary=self._custom_dictionary,
+				enabled_categories=self.linter_enabled_categories,
+				disabled_categories=self.linter_disabled_categories,
+				draft=self.linter_draft,
 			)
-			self.print_errors = self.linter.print_errors
 
-		self.reload_templates()
-
-		self.source_dir.mkdir(parents=True, exist_ok=True)
-
-		if (self.source_dir / "custom_dictionary.txt").exists():
-			self.add_custom_words(*(
-				(self.source_dir / "custom_dictionary.txt").read_text().split('\n')
-			))
+		if self.linter is not None:
+			self.print_errors = self.linter.print_errors
 
 	@staticmethod
 	def reload_templates():
 		templates = pdir / "templates"
 
-		Article._index_template = (templates / "index.rst").read_text()
-		Article._bibliography_template = (templates / "bibliography.rst").read_text()
-		Article._definition_list_template = (templates / "definition_list.rst").read_text()  # noqa: E501
-		Article._config_template = (templates / "conf.py").read_text()
-		Article._title_template = (templates / "title.tex").read_text()
-		Article._preamble_template = (templates / "preamble.tex").read_text()
+		Article._index_template = Template.load(templates / "index.rst", rst_text)
+		Article._bibliography_template = Template.load(templates / "bibliography.rst", rst_text)  # noqa: E501
+		Article._definition_list_template = Template.load(templates / "definition_list.rst")  # noqa: E501
+		Article._config_template = Template.load(templates / "conf.py", python_literal)  # noqa: E501
+		Article._title_template = Template.load(templates / "title.tex")
+		Article._preamble_template = Template.load(templates / "preamble.tex")
+		Article._preview_index_template = Template.load(templates / "preview_index.rst", rst_text)  # noqa: E501
 
 	def reload_extensions(self):
 		self._ext_path.mkdir(parents=True, exist_ok=True)
 		for _ext_file in _base_ext_path.glob("*.py"):
-			shutil.copy(_ext_file, self._ext_path / _ext_file.name)
+			target = self._ext_path / _ext_file.name
+			if not (
+				target.exists() and  # noqa: W504
+				filecmp.cmp(_ext_file, target, shallow=False)
+			):
+				shutil.copy(_ext_file, target)
 
 	def add_custom_words(self, *words: str):
-		self._custom_dictionary.update(filter(bool, (
-			word.strip().lower()
-			for word in words
-		)))
+		new_words = {
+			word
+			for word in (word.strip().lower() for word in words)
+			if word and word not in self._custom_dictionary
+		}
+		if not new_words:
+			return
 
-		(self.source_dir / "custom_dictionary.txt").write_text(
-			"\n".join(self._custom_dictionary)
-		)
+		self._custom_dictionary.update(new_words)
+
+		# custom_dictionary.txt is an append-only journal, one word per line
+		with (self.source_dir / "custom_dictionary.txt").open('a') as journal:
+			journal.write("".join(f"\n{word}" for word in sorted(new_words)))
+
+	def set_linter_draft(self, draft: bool = True):
+		self.linter_draft = draft
+		if self.linter is not None:
+			self.linter.configure_rules(draft=draft)
 
 	def set_config(
 		self,
@@ -114,60 +312,45 @@ class Article:
 		definitions: str = "definitions.rst",
 		definition_list: str = "definition_list.rst",
 		bibliography: str = "bibliography.bib",
+		profile: bool = False,
 	):
 		if base is None:
 			base = self.source_dir
 
-		assert '"' not in project, "Project name cannot contain quotes"
-		assert '"' not in title, "Title cannot contain quotes"
-		assert '"' not in subtitle, "Subtitle cannot contain quotes"
-		assert '"' not in author, "Author cannot contain quotes"
-		assert '"' not in institution, "Institution cannot contain quotes"
-		assert str(dark) in ('True', 'False'), "Dark mode must be a boolean"
-		assert not any((
-			'"' in ext
-			for ext in extensions
-		)), "Extensions cannot contain quotes"
+		assert isinstance(dark, bool), "Dark mode must be a boolean"
+		assert isinstance(profile, bool), "Profile must be a boolean"
 
 		self.reload_extensions()
 
 		self.write(
 			"title.tex",
-			Article._title_template,
+			Article._title_template.render(),
 			base=base,
 			enable_linter=False,
 			add_fname_title=False,
 		)
 		self.write(
 			"preamble.tex",
-			Article._preamble_template,
+			Article._preamble_template.render(),
 			base=base,
 			enable_linter=False,
 			add_fname_title=False,
 		)
 		self.write(
 			"conf.py",
-			Article._config_template.replace(
-				'___1_{extensions}___',
-				"\",\n\t\"".join(extensions)
-			).replace(
-				'___1_{project}___',
-				project
-			).replace(
-				'___1_{title}___',
-				title
-			).replace(
-				'___1_{subtitle}___',
-				subtitle
-			).replace(
-				'___1_{author}___',
-				author
-			).replace(
-				'___1_{institution}___',
-				institution
-			).replace(
-				'___1_{dark}___',
-				'True' if dark else 'False'
+			Article._config_template.render(
+				extensions=set(extensions),
+				project=project,
+				title=title,
+				subtitle=subtitle,
+				author=author,
+				institution=institution,
+				latex_title=latex_escape(title),
+				latex_subtitle=latex_escape(subtitle),
+				latex_author=latex_escape(author),
+				latex_institution=latex_escape(institution),
+				dark=dark,
+				profile=profile,
 			),
 			base=base,
 			enable_linter=False,
@@ -207,7 +390,7 @@ class Article:
 		if base is None:
 			base = self.source_dir
 
-		index = [Article._index_template.format(toctree="\n\t".join(files))]
+		index = [Article._index_template.render(toctree=list(files))]
 
 		if not index[0].endswith("\n"):
 			index.append('')
@@ -240,24 +423,81 @@ class Article:
 		base: Optional[Path] = None,
 		enable_linter: bool = None,
 		style: str = "unsrt",
+		cited_only: bool = False,
 	):
+		'''Sets the bibliography of the article.
+
+		With ``cited_only``, ``content`` is kept next to ``fname`` with a
+		``.full.bib`` suffix, and every build prunes ``fname`` down to the
+		cited entries, see ``prune_bibliography``.
+		'''
 		if base is None:
 			base = self.source_dir
 
 		self.write(
 			"bibliography.rst",
-			Article._bibliography_template.format(style=style),
+			Article._bibliography_template.render(style=style),
 			base=base,
 			enable_linter=enable_linter,
 			add_fname_title=False,
 		)
+
+		full_file = Path(fname).with_suffix(full_suffix)
+		if not cited_only:
+			(base / full_file).unlink(missing_ok=True)
+			self.write(
+				fname,
+				content,
+				base=base,
+				enable_linter=False,
+				add_fname_title=False,
+			)
+			return
+
 		self.write(
-			fname,
+			full_file,
 			content,
 			base=base,
 			enable_linter=False,
 			add_fname_title=False,
 		)
+		self.prune_bibliography(source_dir=base, fname=fname)
+
+	def prune_bibliography(
+		self,
+		*,
+		source_dir: Optional[Path] = None,
+		fname: Path | str = "bibliography.bib",
+	) -> Optional[set[str]]:
+		'''Keeps only the entries cited by the sources in ``fname``.
+
+		Citations are ``:cite:``, ``:fcite:`` and ``[key]_`` references.
+		Does nothing (and returns ``None``) unless the bibliography was set
+		with ``cited_only``; otherwise returns the cited keys.
+		'''
+		if source_dir is None:
+			source_dir = self.source_dir
+
+		full_file = source_dir / Path(fname).with_suffix(full_suffix)
+		if not full_file.exists():
+			return None
+
+		if source_dir == self.source_dir:
+			with self._lock:
+				self.project_index.refresh()
+				keys = self.project_index.cited_keys()
+		else:
+			keys = cited_keys(
+				path.read_text()
+				for path in sorted(source_dir.rglob('*.rst'))
+			)
+		prune_bibliography_file(
+			full_file,
+			source_dir / fname,
+			keys,
+			cache_dir=self.cache_dir,
+		)
+		return keys
 
 	def set_definitions(
 		self,
@@ -272,7 +512,7 @@ class Article:
 
 		self.write(
 			"definition_list.rst",
-			Article._definition_list_template,
+			Article._definition_list_template.render(),
 			base=base,
 			enable_linter=enable_linter,
 			add_fname_title=False,
@@ -297,27 +537,13 @@ class Article:
 		raise_on_error: bool = False,
 		add_fname_title: bool = False,
 	):
-		if base is None:
-			base = self.source_dir
-
-		if base is not None:
-			file = base / file
-		elif not isinstance(file, Path):
-			file = Path(file)
-
-		file.parent.mkdir(
-			parents=True,
-			exist_ok=True,
+		file, content = self._prepare_file(
+			file,
+			content,
+			base=base,
+			add_fname_title=add_fname_title,
 		)
 
-		content = content.strip('\n')
-
-		if file.suffix == '.rst':
-			if add_fname_title:
-				content = f"{file.stem.upper()}\n{'^' * len(file.stem)}\n\n{content}\n"
-			else:
-				content = f"{content}\n"
-
 		lang_errors = syn_errors = False
 
 		if (
@@ -328,23 +554,26 @@ class Article:
 		):
 			self.linter.lint_language(
 				content,
-				content_extension=file.suffix
+				content_extension=file.suffix,
+				full=not self.quick_linting,
 			)
+			self._track_lint(file)
 			if len(self.linter.language_errors):
 				if raise_on_error:
 					self.linter.print_language_errors()
 					raise ValueError("Language errors found")
 				lang_errors = True
 		elif self.linter:
-			self.linter.language_errors.clear()
+			self.linter.language_errors = []
 
-		file.write_text(content)
+		write_atomically({file: content})
+		self._index_files({file: content})
 
 		if (
 			self.linter and  # noqa: W504
 			enable_linter and  # noqa: W504
 			enable_syntax_linting and  # noqa: W504
-			self.linter is not None
+			file.suffix in syntax_lint_suffixes
 		):
 			self.linter.lint_syntax(file)
 			if len(self.linter.syntax_errors):
@@ -353,96 +582,985 @@ class Article:
 					raise ValueError("Syntax errors found")
 				syn_errors = True
 		elif self.linter:
-			self.linter.syntax_errors.clear()
+			self.linter.syntax_errors = []
 
 		if syn_errors or lang_errors:
 			self.print_errors()
 
+	def write_many(
+		self,
+		files: dict[Path | str, str],
+		*,
+		base: Optional[Path] = None,
+		enable_linter: bool = True,
+		enable_syntax_linting: bool = True,
+		enable_language_linting: bool = True,
+		raise_on_error: bool = False,
+		add_fname_title: bool = False,
+	):
+		prepared = dict(
+			self._prepare_file(
+				file,
+				content,
+				base=base,
+				add_fname_title=add_fname_title,
+			)
+			for file, content in files.items()
+		)
+
+		lint = bool(self.linter and enable_linter)
+		lint_language = lint and enable_language_linting
+
+		if lint_language:
+			self.linter.lint_many(prepared, full=not self.quick_linting)
+			for file in prepared:
+				self._track_lint(file)
+			if len(self.linter.language_errors) and raise_on_error:
+				self.linter.print_file_errors(print_info=False)
+				raise ValueError("Language errors found")
+		elif lint:
+			self.linter.lint_many({})
+
+		write_atomically(prepared)
+		self._index_files(prepared)
+
+		if lint and enable_syntax_linting:
+			syntax_errors = self.linter.check_syntax(
+				file
+				for file in prepared
+				if file.suffix in syntax_lint_suffixes
+			)
+			with self._lock:
+				# Rebound, never updated in place, like the linter results
+				file_errors = dict(self.linter.file_errors)
+				all_syntax_errors = list(self.linter.syntax_errors)
+				for file, errors in syntax_errors.items():
+					file_syntax, file_language = file_errors.get(file, ([], []))
+					file_errors[file] = ([*file_syntax, *errors], file_language)
+					all_syntax_errors.extend(errors)
+
+				self.linter.file_errors = file_errors
+				self.linter.syntax_errors = all_syntax_errors
+
+			if len(self.linter.syntax_errors) and raise_on_error:
+				self.linter.print_file_errors(print_info=False)
+				raise ValueError("Syntax errors found")
+
+		if lint and (
+			len(self.linter.syntax_errors) or  # noqa: W504
+			len(self.linter.language_errors)
+		):
+			self.linter.print_file_errors(print_info=False)
+
+	def _index_files(self, files: dict[Path, str]):
+		with self._lock:
+			for file, content in files.items():
+				if file.is_relative_to(self.source_dir):
+					self.project_index.update(file, content)
+
+			if self.reference_checking:
+				self.print_unresolved_references(
+					self.project_index.unresolved(files)
+				)
+
+	def check_references(
+		self,
+		*files: Path | str,
+		base: Optional[Path] = None,
+	) -> dict[Path, list]:
+		'''Finds ``:abbrev:``, citation and ``:ref:`` references that the
+		project does not define, in ``files`` or in every source.
+
+		The index is refreshed from disk first, so files edited outside of
+		``write`` are seen too.
+		'''
+		if base is None:
+			base = self.source_dir
+
+		with self._lock:
+			self.project_index.refresh()
+			unresolved = self.project_index.unresolved(
+				[base / file for file in files] if files else None
+			)
+
+		self.print_unresolved_references(unresolved)
+		return unresolved
+
+	@staticmethod
+	def print_unresolved_references(unresolved: dict[Path, list]):
+		for file, references in unresolved.items():
+			print(f"## {file} ##")
+			for reference in references:
+				print(reference)
+
+	def _track_lint(self, file: Path):
+		with self._lock:
+			if self.quick_linting:
+				self._pending_lint.add(file)
+			else:
+				self._pending_lint.discard(file)
+
+	def lint(
+		self,
+		*files: Path | str,
+		base: Optional[Path] = None,
+		raise_on_error: bool = False,
+	) -> bool:
+		'''Runs the full LanguageTool check over ``files`` in one batch.
+
+		Without ``files``, checks every file the quick tier linted since its
+		last full check. Returns whether no language errors were found.
+		'''
+
+		if self.linter is None:
+			return True
+
+		if base is None:
+			base = self.source_dir
+
+		with self._lock:
+			if files:
+				paths = {base / file for file in files}
+			else:
+				paths = set(self._pending_lint)
+
+		contents = {
+			path: path.read_text()
+			for path in sorted(paths)
+			if path.exists()
+		}
+		self.linter.lint_many(contents)
+
+		with self._lock:
+			self._pending_lint -= paths
+
+		if len(self.linter.language_errors):
+			self.linter.print_file_errors(print_info=False)
+			if raise_on_error:
+				raise ValueError("Language errors found")
+			return False
+
+		return True
+
+	def _prepare_file(
+		self,
+		file: Path | str,
+		content: str,
+		*,
+		base: Optional[Path] = None,
+		add_fname_title: bool = False,
+	) -> tuple[Path, str]:
+		if base is None:
+			base = self.source_dir
+
+		if base is not None:
+			file = base / file
+		elif not isinstance(file, Path):
+			file = Path(file)
+
+		content = content.strip('\n')
+
+		if file.suffix == '.rst':
+			if add_fname_title:
+				content = f"{file.stem.upper()}\n{'^' * len(file.stem)}\n\n{content}\n"
+			else:
+				content = f"{content}\n"
+
+		return file, content
+
+	@cancellable
 	def build(
 		self,
 		*,
 		source_dir: Optional[Path] = None,
 		build_dir: Optional[Path] = None,
 		log_file: Optional[Path] = None,
-	):
+		on_output: Optional[Callable[[str], None]] = None,
+		abort_on_error: bool = False,
+		use_cache: bool = True,
+		full_latex: bool = False,
+		optimize: bool = True,
+		lint: bool = True,
+		in_memory: Optional[bool] = None,
+		variants: Optional[list[Variant]] = None,
+	) -> bool:
+		'''Builds the PDF through Sphinx and LaTeX.
+
+		With ``latex_units`` enabled, only the units whose LaTeX changed are
+		compiled (through ``\\includeonly``) while the ``.aux`` files of the
+		rest keep references, page numbers and the table of contents
+		consistent. The resulting PDF then only holds the changed units;
+		``full_latex`` forces a complete document.
+
+		Complete PDFs go through ``pdf_optimizer`` when one is set, unless
+		``optimize`` is false. With ``quick_linting``, the files still
+		missing a full language check are linted first unless ``lint`` is
+		false; their errors, and a LanguageTool that cannot start, are
+		reported but do not stop the build.
+
+		``in_memory`` (``memory_build`` by default) runs the build in a
+		RAM-backed workspace and only copies the outputs and incremental
+		state back to ``build_dir``. Builds growing past ``memory_limit``
+		or filling the workspace are retried on disk.
+
+		With ``variants``, one PDF is built per variant into
+		``build_dir/variants/<name>``. Sphinx reads the sources once and
+		writes a LaTeX tree per variant, which are then compiled in
+		parallel.
+		'''
 		if source_dir is None:
 			source_dir = self.source_dir
 
 		if build_dir is None:
 			build_dir = self.build_dir
 
+		if in_memory is None:
+			in_memory = self.memory_build
+
+		if in_memory:
+			built = self._build_in_memory(
+				source_dir=source_dir,
+				build_dir=build_dir,
+				log_file=log_file,
+				on_output=on_output,
+				abort_on_error=abort_on_error,
+				use_cache=use_cache,
+				full_latex=full_latex,
+				optimize=optimize,
+				lint=lint,
+				variants=variants,
+			)
+			if built is not None:
+				return built
+
 		if log_file is None:
 			log_file = build_dir / "doc.log"
 
-		sphinx_result = subprocess.run(
+		if on_output is None:
+			on_output = self.on_output
+
+		if lint and self._pending_lint:
+			# Without LanguageTool (or Java) the files stay pending
+			try:
+				self.lint()
+			except Exception as e:
+				print("Skipped the full language check:", e)
+
+		self.prune_bibliography(source_dir=source_dir)
+
+		with self._lock:
+			self.build_messages = []
+
+		should_abort = None
+		if abort_on_error:
+			should_abort = lambda message: message.is_error  # noqa: E731
+
+		env = {
+			**os.environ,
+			'RST_ARTICLES_CACHE_DIR': str(Path(self.cache_dir).resolve()),
+		}
+
+		optimizer = self.pdf_optimizer if optimize else None
+		cache_options = (
+			f"latex_units={self.latex_units} "
+			f"optimize={optimizer and optimizer.tools}"
+		)
+
+		# A restored environment is reused instead of reading everything
+		incremental = (
+			self._restored_sources is not None and  # noqa: W504
+			source_dir == self.source_dir and  # noqa: W504
+			self._match_restored_sources(source_dir)
+		)
+
+		sphinx_args = () if incremental else ('-E',)
+		if self.latex_units:
+			sphinx_args += ('-D', 'latex_unit_markers=1')
+		if self.sphinx_linting:
+			sphinx_args += self._language_lint_args()
+
+		if variants:
+			return self._build_variants(
+				variants,
+				source_dir=source_dir,
+				build_dir=build_dir,
+				sphinx_args=sphinx_args,
+				cache_options=cache_options,
+				full_latex=full_latex,
+				optimizer=optimizer,
+				use_cache=use_cache,
+				env=env,
+				on_output=on_output,
+				should_abort=should_abort,
+			)
+
+		cache_key = None
+		if use_cache and self.build_cache is not None:
+			cache_key = self.build_cache.key(
+				source_dir=source_dir,
+				ext_dir=self._ext_path,
+				options=cache_options,
+			)
+			if self.build_cache.restore(cache_key, build_dir):
+				print("Restored cached PDF at:", build_dir / "doc.pdf")
+				print("Restored cached LaTeX at:", build_dir / "doc.tex")
+				return True
+
+			env['SOURCE_DATE_EPOCH'] = str(
+				self.build_cache.get_source_date_epoch(source_dir)
+			)
+
+		run_options = dict(
+			env=env,
+			on_output=on_output,
+			should_abort=should_abort,
+			cancelled=self._cancelled,
+		)
+
+		sphinx_succeeded = self._run_sphinx(
+			source_dir,
+			build_dir,
+			extra_args=sphinx_args,
+			**run_options,
+		)
+		self._restored_sources = None
+		if not sphinx_succeeded:
+			return False
+
+		return self._compile(
+			build_dir,
+			log_file,
+			full_latex=full_latex,
+			optimizer=optimizer,
+			cache_key=cache_key,
+			**run_options,
+		)
+
+	def _language_lint_args(self) -> tuple[str, ...]:
+		'''Configures language_lint.py like the notebook linter.'''
+
+		if self.linter is not None:
+			language = self.linter.language
+			enabled = self.linter.enabled_categories
+			disabled = self.linter.disabled_categories
+			draft = self.linter.draft
+		else:
+			language = self.linter_lang
+			enabled = self.linter_enabled_categories
+			disabled = self.linter_disabled_categories
+			draft = self.linter_draft
+
+		args = (
+			'-D', 'language_lint=1',
+			'-D', f"language_lint_language={language}",
+			'-D', f"language_lint_draft={int(draft)}",
+		)
+		if enabled:
+			args += ('-D', "language_lint_enabled_categories={}".format(
+				','.join(sorted(enabled))
+			))
+		if disabled:
+			args += ('-D', "language_lint_disabled_categories={}".format(
+				','.join(sorted(disabled))
+			))
+		return args
+
+	def _compile(
+		self,
+		build_dir: Path,
+		log_file: Path,
+		*,
+		full_latex: bool,
+		optimizer: Optional[PDFOptimizer],
+		cache_key: Optional[str],
+		output: Optional[list[str]] = None,
+		**run_options,
+	) -> bool:
+		'''Compiles the LaTeX tree Sphinx wrote to ``build_dir``.
+
+		With ``output``, printed lines are collected there instead, and
+		``latex_logs`` is left to the caller, so several trees can be
+		compiled at once.
+		'''
+
+		latex_options = {}
+		units = None
+		if self.latex_units:
+			units = split_units(build_dir / "doc.tex")
+
+			if units.up_to_date and not full_latex:
+				report(output, "LaTeX units up to date at:", build_dir / "doc.pdf")
+				return True
+
+			if not (units.needs_full_compile or full_latex):
+				latex_options['command'] = (
+					'make', '--silent', 'doc.pdf',
+					f"LATEXMKOPTS='-usepretex={units.includeonly()}'",
+				)
+
+		if not self._run_latex(
+			build_dir,
+			log_file,
+			output=output,
+			**latex_options,
+			**run_options,
+		):
+			return False
+
+		complete = 'command' not in latex_options
+		if units is not None:
+			units.commit(complete=complete)
+
+		if not complete:
+			report(
+				output,
+				"Generated partial PDF at:", build_dir / "doc.pdf",
+				f"(units: {', '.join(units.changed)})",
+			)
+			return True
+
+		if optimizer is not None:
+			# Optional, a failure keeps the PDF LaTeX wrote
+			try:
+				self.optimize_pdf(
+					build_dir=build_dir,
+					optimizer=optimizer,
+					output=output,
+				)
+			except (subprocess.CalledProcessError, OSError) as e:
+				report(output, "PDF optimization failed, kept the unoptimized PDF:", e)
+
+		if cache_key is not None:
+			self.build_cache.store(cache_key, build_dir)
+
+		report(output, "Generated PDF at:", build_dir / "doc.pdf")
+		report(output, "Generated LaTeX at:", build_dir / "doc.tex")
+		return True
+
+	def _build_variants(
+		self,
+		variants: list[Variant],
+		*,
+		source_dir: Path,
+		build_dir: Path,
+		sphinx_args: tuple[str, ...],
+		cache_options: str,
+		full_latex: bool,
+		optimizer: Optional[PDFOptimizer],
+		use_cache: bool,
+		env: dict[str, str],
+		**run_options,
+	) -> bool:
+		'''Writes every variant from one read phase, then compiles them.
+
+		The first Sphinx run reads the sources into a doctree directory
+		shared by all variants. The following runs reuse its environment,
+		so they only write the LaTeX tree of their variant.
+		'''
+
+		names = [variant.name for variant in variants]
+		assert len(set(names)) == len(names), "Variant names must be unique"
+
+		variant_dirs = {
+			variant.name: build_dir / variants_dir_name / variant.name
+			for variant in variants
+		}
+
+		cache_keys = dict.fromkeys(names)
+		if use_cache and self.build_cache is not None:
+			for variant in variants:
+				cache_keys[variant.name] = self.build_cache.key(
+					source_dir=source_dir,
+					ext_dir=self._ext_path,
+					options=f"{cache_options} variant={variant.overrides()}",
+				)
+
+			if all(
+				self.build_cache.restore(key, variant_dirs[name])
+				for name, key in cache_keys.items()
+			):
+				for name in names:
+					print("Restored cached PDF at:", variant_dirs[name] / "doc.pdf")
+				return True
+
+			env['SOURCE_DATE_EPOCH'] = str(
+				self.build_cache.get_source_date_epoch(source_dir)
+			)
+
+		doctree_dir = build_dir / variants_dir_name / ".doctrees"
+		for index, variant in enumerate(variants):
+			extra_args = ('-d', str(doctree_dir), *sphinx_args)
+			if index > 0:
+				extra_args = tuple(arg for arg in extra_args if arg != '-E')
+
+			if not self._run_sphinx(
+				source_dir,
+				variant_dirs[variant.name],
+				extra_args=extra_args,
+				env={**env, variant_env_var: variant.overrides()},
+				cancelled=self._cancelled,
+				**run_options,
+			):
+				return False
+
+		self._restored_sources = None
+		outputs = {name: [] for name in names}
+		with ThreadPoolExecutor(max_workers=len(variants)) as executor:
+			results = [
+				executor.submit(
+					self._compile,
+					variant_dirs[name],
+					variant_dirs[name] / "doc.log",
+					full_latex=full_latex,
+					optimizer=optimizer,
+					cache_key=cache_keys[name],
+					output=outputs[name],
+					env=env,
+					cancelled=self._cancelled,
+					**run_options,
+				)
+				for name in names
+			]
+		succeeded = [result.result() for result in results]
+
+		# Only now, so the output of concurrent compiles does not interleave
+		latex_logs = []
+		for name in names:
+			for line in "\n".join(outputs[name]).splitlines():
+				print(f"[{name}]", line)
+			log = self._read_latex_logs(variant_dirs[name] / "doc.log")
+			latex_logs.append(f"[{name}]\n{log}")
+		with self._lock:
+			self.latex_logs = "\n".join(latex_logs)
+
+		return all(succeeded)
+
+	def _build_in_memory(
+		self,
+		*,
+		build_dir: Path,
+		**build_options,
+	) -> Optional[bool]:
+		'''Builds in a memory workspace, ``None`` when it must run on disk.'''
+
+		workspace = MemoryWorkspace.create(build_dir, limit=self.memory_limit)
+		if workspace is None:
+			print("No memory workspace available, building on disk")
+			return None
+
+		try:
+			with workspace.watch(self.cancel):
+				workspace.load()
+				built = self.build(
+					build_dir=workspace.path,
+					in_memory=False,
+					**build_options,
+				)
+
+			if not built and workspace.exhausted:
+				print("Build outgrew the memory workspace, building on disk")
+				return None
+
+			workspace.save()
+		except OSError as e:
+			if e.errno != errno.ENOSPC:
+				raise
+			print("Memory workspace is full, building on disk")
+			return None
+		finally:
+			workspace.close()
+
+		if built:
+			print("Copied the build outputs to:", build_dir)
+		return built
+
+	def _match_restored_sources(self, source_dir: Path) -> bool:
+		'''Gives the unchanged sources their restored modification times.
+
+		Sphinx then only re-reads the sources changed since the state was
+		saved. Returns whether any source is unchanged.
+		'''
+
+		unchanged = changed = 0
+		for name, (digest, mtime) in self._restored_sources.items():
+			path = source_dir / name
+			try:
+				if file_digest(path) != digest:
+					changed += 1
+					continue
+				os.utime(path, ns=(mtime, mtime))
+			except OSError:
+				continue
+			unchanged += 1
+
+		print(
+			f"Restored build state: {unchanged} sources unchanged, "
+			f"{changed} changed"
+		)
+		return unchanged > 0
+
+	def _state_roots(self, build_dir: Optional[Path], caches: bool):
+		roots = {'build': build_dir or self.build_dir}
+		if caches:
+			roots['cache'] = Path(self.cache_dir)
+		return roots
+
+	def save_state(
+		self,
+		path: Path | str,
+		*,
+		build_dir: Optional[Path] = None,
+		caches: bool = True,
+	) -> bool:
+		'''Saves the build directory and the caches to the archive ``path``.
+
+		Meant for storage that outlives the runtime, such as a mounted
+		Drive. The archive is only rewritten when the state changed.
+		'''
+
+		archive = StateArchive(Path(path))
+		saved = archive.save(
+			self._state_roots(build_dir, caches),
+			source_dir=self.source_dir,
+		)
+		if saved:
+			print("Saved build state to:", path)
+		else:
+			print("Build state unchanged at:", path)
+		return saved
+
+	def restore_state(
+		self,
+		path: Path | str,
+		*,
+		build_dir: Optional[Path] = None,
+		caches: bool = True,
+	) -> RestoredState:
+		'''Restores the build directory and the caches saved to ``path``.
+
+		Every file is checked against its digest. The next ``build`` reuses
+		the restored Sphinx environment instead of reading every source:
+		the sources still matching their saved digests keep their saved
+		modification times, so only the others are read again.
+		'''
+
+		restored = StateArchive(Path(path)).restore(
+			self._state_roots(build_dir, caches),
+		)
+		if build_dir in (None, self.build_dir):
+			self._restored_sources = restored.sources
+
+		print("Restored build state from:", path, f"({restored})")
+		return restored
+
+	def _run_sphinx(
+		self,
+		source_dir: Path,
+		build_dir: Path,
+		*,
+		extra_args: tuple[str, ...] = ('-E',),
+		**run_options,
+	) -> bool:
+		sphinx_result = run_streaming(
 			[
 				'sphinx-build',
 				'-b', 'latex',
 				'-j', 'auto',
-				'-E',
+				*extra_args,
 				source_dir,
 				build_dir
 			],
-			check=False,
-			capture_output=True,
-			text=True
+			parser=SphinxLogParser(),
+			on_message=self._add_build_message,
+			max_lines=self.max_log_lines,
+			**run_options,
 		)
 
+		stdout = "\n".join(sphinx_result.stdout).strip()
+		stderr = "\n".join(sphinx_result.stderr).strip()
 		self.sphinx_logs = f"""
 [Sphinx STDOUT]
-{sphinx_result.stdout.strip()}
+{stdout}
 [Sphinx STDERR]
-{sphinx_result.stderr.strip()}
+{stderr}
 """
-		if sphinx_result.returncode != 0:
+		if sphinx_result.returncode != 0 or sphinx_result.aborted:
 			print(
 				"Error: Sphinx build failed "
 				f"(Return code {sphinx_result.returncode}). Aborting."
 			)
 			print(self.sphinx_logs)
+			return False
+
+		return True
+
+	def _run_latex(
+		self,
+		build_dir: Path,
+		log_file: Path,
+		*,
+		command: tuple[str, ...] = ('make', '-j', '8', '--silent'),
+		output: Optional[list[str]] = None,
+		**run_options,
+	) -> bool:
+		make_result = run_streaming(
+			command,
+			parser=LaTeXLogParser(),
+			cwd=build_dir,
+			on_message=self._add_build_message,
+			max_lines=self.max_log_lines,
+			**run_options,
+		)
+
+		latex_logs = self._read_latex_logs(log_file)
+		if output is None:
+			self.latex_logs = latex_logs
+
+		if make_result.returncode != 0 or make_result.aborted:
+			report(output, "\nXXXXXXXXXXXX")
+			report(output, ">>> BEGIN DOC.LOG CONTENT (make failed) <<<")
+			report(output, latex_logs)
+			report(output, ">>> END DOC.LOG CONTENT <<<")
+			return False
+
+		return True
+
+	def _read_latex_logs(self, log_file: Path) -> str:
+		try:
+			return "\n".join(tail_file(log_file, self.max_log_lines))
+		except Exception as e:
+			return f"An exception occurred: {e}"
+
+	@cancellable
+	def preview(
+		self,
+		file: Path | str,
+		*,
+		source_dir: Optional[Path] = None,
+		build_dir: Optional[Path] = None,
+		definitions: str = "definitions.rst",
+		bibliography: str = "bibliography.bib",
+		on_output: Optional[Callable[[str], None]] = None,
+	) -> bool:
+		'''Builds a single source file into a standalone PDF.
+
+		The preview uses the project configuration, preamble and extensions
+		but skips the title page, table of contents, the rest of the toctree
+		and the definition list, and only typesets the references the file
+		cites.
+		The PDF is written to ``build_dir / "preview" / "build"``.
+		'''
+
+		if source_dir is None:
+			source_dir = self.source_dir
+
+		if build_dir is None:
+			build_dir = self.build_dir
+
+		if on_output is None:
+			on_output = self.on_output
+
+		file = Path(file)
+		preview_dir = build_dir / "preview"
+		preview_source = preview_dir / "source"
+		preview_build = preview_dir / "build"
+
+		shutil.rmtree(preview_source, ignore_errors=True)
+		preview_source.mkdir(parents=True)
+
+		# Everything but the other documents, so assets and the cached
+		# definitions resolve exactly like in the full build
+		for path in source_dir.rglob('*'):
+			relative = path.relative_to(source_dir)
+			if path.is_dir() or (path.suffix == '.rst' and relative != file):
+				continue
+			link_or_copy(path, preview_source / relative)
+
+		# Included only, so Sphinx does not read it as a document of its own
+		definitions_include = f"{definitions}.inc"
+		if (source_dir / definitions).exists():
+			link_or_copy(
+				source_dir / definitions,
+				preview_source / definitions_include,
+			)
 		else:
-			make_result = subprocess.run(
-				['make', '-j', '8', '--silent'],
-				cwd=build_dir,
-				capture_output=True,
-				text=True,
-				check=False
+			(preview_source / definitions_include).write_text("")
+
+		# Every entry the file cites, also through :fcite:, is listed with
+		# :all:, since :cited: only registers the :cite:d ones
+		full_bibliography = source_dir / Path(bibliography).with_suffix(full_suffix)
+		if not full_bibliography.exists():
+			full_bibliography = source_dir / bibliography
+		if full_bibliography.exists():
+			# Linked to the project file, which must not be overwritten
+			(preview_source / bibliography).unlink(missing_ok=True)
+			prune_bibliography_file(
+				full_bibliography,
+				preview_source / bibliography,
+				cited_keys([(source_dir / file).read_text()]),
+				cache_dir=self.cache_dir,
 			)
 
-			try:
-				self.latex_logs = log_file.read_text()
-			except Exception as e:
-				self.latex_logs = f"An exception occurred: {e}"
+		ext_link = preview_dir / self._ext_path.name
+		if not ext_link.exists():
+			link_or_copy(self._ext_path, ext_link)
 
-			if make_result.returncode != 0:
-				print("\nXXXXXXXXXXXX")
-				print(">>> BEGIN DOC.LOG CONTENT (make failed) <<<")
-				print(self.latex_logs)
-				print(">>> END DOC.LOG CONTENT <<<")
-			else:
-				print("Generated PDF at:", build_dir / "doc.pdf")
-				print("Generated LaTeX at:", build_dir / "doc.tex")
+		style = 'unsrt'
+		bibliography_rst = source_dir / "bibliography.rst"
+		if bibliography_rst.exists():
+			match = bibliography_style_pattern.search(bibliography_rst.read_text())
+			if match is not None:
+				style = match[1]
+
+		index = Article._preview_index_template.render(
+			docname=file.with_suffix('').as_posix(),
+			definitions=definitions_include,
+			bibliography=bibliography,
+			style=style,
+		)
+		(preview_source / "index.rst").write_text(index)
+
+		with self._lock:
+			self.build_messages = []
+		run_options = dict(
+			env={
+				**os.environ,
+				'RST_ARTICLES_CACHE_DIR': str(Path(self.cache_dir).resolve()),
+			},
+			on_output=on_output,
+			cancelled=self._cancelled,
+		)
+
+		if not self._run_sphinx(
+			preview_source,
+			preview_build,
+			extra_args=(
+				'-E',
+				'-D', 'latex_elements.maketitle=',
+				'-D', 'latex_elements.tableofcontents=',
+			),
+			**run_options,
+		):
+			return False
+
+		if not self._run_latex(
+			preview_build,
+			preview_build / "doc.log",
+			**run_options,
+		):
+			return False
+
+		print("Generated preview PDF at:", preview_build / "doc.pdf")
+		return True
+
+	def optimize_pdf(
+		self,
+		*,
+		build_dir: Optional[Path] = None,
+		optimizer: Optional[PDFOptimizer] = None,
+		output: Optional[list[str]] = None,
+	) -> PDFOptimization:
+		'''Recompresses and linearizes the built PDF in place.'''
+
+		if build_dir is None:
+			build_dir = self.build_dir
+
+		if optimizer is None:
+			optimizer = self.pdf_optimizer or PDFOptimizer(
+				directory=Path(self.cache_dir) / 'pdf',
+			)
+
+		optimization = optimizer.optimize(build_dir / "doc.pdf")
+		report(output, "Optimized PDF:", optimization)
+		return optimization
+
+	def cancel(self):
+		'''Stops the running build, or the next one if none is running.
+
+		Safe to call from any thread; the build returns ``False``.
+		'''
+		self._cancelled.set()
+
+	def snapshot(self) -> dict:
+		'''Copies the build and linter state, for readers on other threads.'''
+
+		with self._lock:
+			state = dict(
+				build_messages=list(self.build_messages),
+				sphinx_logs=self.sphinx_logs,
+				latex_logs=self.latex_logs,
+				syntax_errors=[],
+				language_errors=[],
+				file_errors={},
+			)
+			if self.linter is not None:
+				state.update(
+					syntax_errors=list(self.linter.syntax_errors),
+					language_errors=list(self.linter.language_errors),
+					file_errors={
+						file: (list(syntax_errors), list(language_errors))
+						for file, (syntax_errors, language_errors)
+						in self.linter.file_errors.items()
+					},
+				)
+
+		return state
+
+	def _add_build_message(self, message: BuildMessage):
+		with self._lock:
+			self.build_messages.append(message)
+
+	def print_build_messages(self, *, levels: Optional[set[str]] = None):
+		for message in self.build_messages:
+			if levels is None or message.level in levels:
+				print(message)
 
 	def render_pdf(
 		self,
 		*,
 		build_dir: Optional[Path] = None,
 		show_page: Optional[int] = None,
+		max_size: int = 1400,
+		image_format: str = 'webp',
+		quality: int = 80,
+		viewer: bool = False,
 	):
+		'''Displays the PDF pages as compressed images in the notebook.
+
+		Pages are rendered one at a time with their longest side capped at
+		``max_size`` pixels, and embedded as ``image_format`` (``webp``,
+		``jpeg`` or ``png``) at ``quality``. With ``viewer``, a widget shows
+		one page at a time instead, rendering it when it is looked at.
+		'''
 		if build_dir is None:
 			build_dir = self.build_dir
 
 		if convert_from_path is None or display is None:
 			raise ImportError("pdf2image and IPython are required to render the PDF")
 
-		image = None
-		for ii, image in enumerate(
-			convert_from_path(
-				build_dir / "doc.pdf"
-			)
-		):
-			if show_page is None or show_page == ii:
-				display(image)
+		assert image_format in image_formats, "Unsupported image format"
+
+		pdf = build_dir / "doc.pdf"
+		render_options = dict(
+			max_size=max_size,
+			image_format=image_format,
+			quality=quality,
+		)
 
-		if image is not None:
-			del image
+		if viewer:
+			if ipywidgets is None:
+				raise ImportError("ipywidgets is required for the page viewer")
+
+			display(PageViewer(pdf, **render_options).widget(show_page or 0))
+			return
+
+		if show_page is None:
+			pages = range(page_count(pdf))
+		else:
+			pages = (show_page,)
+
+		for page in pages:
+			display(Image(
+				data=render_page(pdf, page, **render_options),
+				format=image_format,
+			))
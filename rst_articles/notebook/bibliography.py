@@ -0,0 +1,154 @@
+from typing import Iterable, Optional
+from pathlib import Path
+import tempfile
+import hashlib
+import os
+import re
+
+from rst_articles.defaults import default_cache_dir
+
+
+full_suffix = '.full.bib'
+
+cite_role_pattern = re.compile(r':cite(?::\w+)*:`([^`]*)`')
+first_cite_role_pattern = re.compile(r':fcite:`([^`]*)`')
+citation_reference_pattern = re.compile(r'\[([^\]\s]+)\]_')
+entry_start_pattern = re.compile(r'@\s*(\w+)\s*([{(])')
+crossref_pattern = re.compile(
+	r'crossref\s*=\s*[{"]\s*([^}"\s]+)',
+	re.IGNORECASE,
+)
+
+# Entries without a citation key, always kept
+special_entries = {'string', 'preamble', 'comment'}
+
+
+def cited_keys(texts: Iterable[str]) -> set[str]:
+	'''Citation keys of ``:cite:``, ``:fcite:`` and ``[key]_`` references.'''
+
+	keys = set()
+	for text in texts:
+		for match in cite_role_pattern.finditer(text):
+			keys.update(key.strip() for key in match[1].split(','))
+		for match in first_cite_role_pattern.finditer(text):
+			keys.add(match[1].strip())
+		for match in citation_reference_pattern.finditer(text):
+			# Footnote references: [1]_, [#]_, [#label]_ and [*]_
+			if not (match[1].isdigit() or match[1][0] in '#*'):
+				keys.add(match[1])
+
+	keys.discard('')
+	return keys
+
+
+def split_entries(bib: str) -> list[tuple[Optional[str], str, str]]:
+	'''Splits ``bib`` into ``(type, key, text)`` entries.
+
+	Entries are delimited by balanced braces (or parentheses), so values
+	may span lines and contain ``@``. Text outside of entries, which
+	BibTeX ignores, is dropped.
+	'''
+
+	entries = []
+	match = entry_start_pattern.search(bib)
+	while match is not None:
+		entry_type = match[1].lower()
+		closing = '}' if match[2] == '{' else ')'
+
+		depth = 0
+		end = match.end()
+		while end < len(bib):
+			char = bib[end]
+			if char == closing and depth == 0:
+				break
+			if char == '{':
+				depth += 1
+			elif char == '}':
+				depth -= 1
+			end += 1
+
+		key = None
+		if entry_type not in special_entries:
+			key = bib[match.end():end].partition(',')[0].strip()
+
+		entries.append((entry_type, key, bib[match.start():end + 1]))
+		match = entry_start_pattern.search(bib, end + 1)
+
+	return entries
+
+
+def prune_bibliography(bib: str, keys: set[str]) -> str:
+	'''Keeps the entries of ``keys``, the ones they cross-reference and the
+	``@string`` and ``@preamble`` definitions.'''
+
+	entries = split_entries(bib)
+	by_key = {
+		key.lower(): text
+		for _, key, text in entries
+		if key is not None
+	}
+
+	wanted = set()
+	pending = [key.lower() for key in keys]
+	while pending:
+		key = pending.pop()
+		if key in wanted or key not in by_key:
+			continue
+		wanted.add(key)
+		pending.extend(
+			match[1].lower()
+			for match in crossref_pattern.finditer(by_key[key])
+		)
+
+	return "\n\n".join(
+		text
+		for entry_type, key, text in entries
+		if (
+			entry_type in ('string', 'preamble') or  # noqa: W504
+			(key is not None and key.lower() in wanted)
+		)
+	) + "\n"
+
+
+def prune_bibliography_file(
+	full_file: Path,
+	target: Path,
+	keys: set[str],
+	*,
+	cache_dir: Path = default_cache_dir,
+) -> bool:
+	'''Writes the cited subset of ``full_file`` to ``target``.
+
+	The subset is cached by the digest of the full file and the key set.
+	``target`` is only rewritten when it changes, so Sphinx and the
+	bibtex cache see it as unchanged. Returns whether it was rewritten.
+	'''
+
+	full = full_file.read_bytes()
+	key = hashlib.sha256(full)
+	key.update("\n".join(sorted(keys)).encode())
+	cache_file = Path(cache_dir) / 'bibliography' / f"{key.hexdigest()}.bib"
+
+	if cache_file.is_file():
+		pruned = cache_file.read_text()
+	else:
+		pruned = prune_bibliography(full.decode(errors='replace'), keys)
+		# A unique staging file, as concurrent builds share the cache
+		cache_file.parent.mkdir(parents=True, exist_ok=True)
+		fd, staged = tempfile.mkstemp(
+			dir=cache_file.parent,
+			prefix=f".{cache_file.name}.",
+		)
+		try:
+			with os.fdopen(fd, 'w') as file:
+				file.write(pruned)
+			os.replace(staged, cache_file)
+		except BaseException:
+			os.unlink(staged)
+			raise
+
+	if target.exists() and target.read_text() == pruned:
+		return False
+
+	target.write_text(pruned)
+	return True
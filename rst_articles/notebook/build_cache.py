@@ -0,0 +1,182 @@
+from typing import Iterable, Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+from functools import cache
+from importlib import metadata
+import subprocess
+import tempfile
+import hashlib
+import shutil
+import os
+
+from rst_articles.defaults import default_cache_dir
+
+
+cached_outputs = ('doc.pdf', 'doc.tex')
+
+python_packages = (
+	'sphinx',
+	'docutils',
+	'sphinxcontrib-bibtex',
+	'pybtex',
+	'pygments',
+)
+latex_tools = (
+	'pdflatex',
+	'latexmk',
+)
+
+# 1980-01-01, the reproducible builds default for sources without a
+# commit. Never a modification time, which changes without the contents
+default_source_date_epoch = 315532800
+
+
+@cache
+def tool_versions() -> tuple[str, ...]:
+	versions = []
+
+	for package in python_packages:
+		try:
+			versions.append(f"{package}=={metadata.version(package)}")
+		except metadata.PackageNotFoundError:
+			versions.append(f"{package} missing")
+
+	for tool in latex_tools:
+		try:
+			result = subprocess.run(
+				[tool, '--version'],
+				capture_output=True,
+				text=True,
+				check=False,
+			)
+			versions.append(result.stdout.partition('\n')[0])
+		except OSError:
+			versions.append(f"{tool} missing")
+
+	return tuple(versions)
+
+
+def tree_digests(root: Path) -> Iterable[tuple[str, str]]:
+	if not root.exists():
+		return
+
+	for path in sorted(root.rglob('*')):
+		if path.is_file() and '__pycache__' not in path.parts:
+			with path.open('rb') as file:
+				yield (
+					path.relative_to(root).as_posix(),
+					hashlib.file_digest(file, 'sha256').hexdigest(),
+				)
+
+
+@dataclass
+class BuildCache:
+	'''Content-addressed store of finished builds.
+
+	Entries are keyed by every build input, so a hit can be restored
+	without running Sphinx or LaTeX. The least recently used entries are
+	evicted once the directory grows past ``max_bytes``.
+	'''
+
+	directory: Path = field(default=default_cache_dir / 'builds')
+	max_bytes: int = field(default=2 * 1024 ** 3)
+	# Defaults to $SOURCE_DATE_EPOCH, then to the last commit of the
+	# sources, then to default_source_date_epoch
+	source_date_epoch: Optional[int] = field(default=None)
+
+	def get_source_date_epoch(self, source_dir: Path) -> int:
+		'''Date of the sources, the same on every machine building them.'''
+
+		if self.source_date_epoch is not None:
+			return self.source_date_epoch
+
+		try:
+			return int(os.environ['SOURCE_DATE_EPOCH'])
+		except (KeyError, ValueError):
+			pass
+
+		try:
+			result = subprocess.run(
+				['git', 'log', '-1', '--format=%ct', '--', '.'],
+				cwd=source_dir,
+				capture_output=True,
+				text=True,
+				check=False,
+			)
+			if result.returncode == 0 and result.stdout.strip().isdigit():
+				return int(result.stdout)
+		except OSError:
+			pass
+
+		return default_source_date_epoch
+
+	def key(self, *, source_dir: Path, ext_dir: Path, options: str = '') -> str:
+		hasher = hashlib.sha256()
+
+		for version in tool_versions():
+			hasher.update(f"tool {version}\n".encode())
+
+		hasher.update(
+			f"epoch {self.get_source_date_epoch(source_dir)}\n".encode()
+		)
+		hasher.update(f"options {options}\n".encode())
+
+		for label, root in (('source', source_dir), ('ext', ext_dir)):
+			for name, file_digest in tree_digests(root):
+				hasher.update(f"{label} {name} {file_digest}\n".encode())
+
+		return hasher.hexdigest()
+
+	def _entry(self, key: str) -> Path:
+		return self.directory / key[:2] / key
+
+	def restore(self, key: str, build_dir: Path) -> bool:
+		entry = self._entry(key)
+		if not all((entry / name).is_file() for name in cached_outputs):
+			return False
+
+		build_dir.mkdir(parents=True, exist_ok=True)
+		for name in cached_outputs:
+			shutil.copy2(entry / name, build_dir / name)
+
+		# Marks the entry as recently used for eviction
+		os.utime(entry)
+		return True
+
+	def store(self, key: str, build_dir: Path):
+		entry = self._entry(key)
+		if entry.exists():
+			return
+
+		entry.parent.mkdir(parents=True, exist_ok=True)
+		staging = Path(tempfile.mkdtemp(dir=entry.parent, prefix=f".{key}."))
+		try:
+			for name in cached_outputs:
+				shutil.copy2(build_dir / name, staging / name)
+			staging.rename(entry)
+		except OSError:
+			shutil.rmtree(staging, ignore_errors=True)
+			if not entry.exists():
+				raise
+
+		self.evict()
+
+	def evict(self):
+		entries = []
+		total = 0
+		for entry in self.directory.glob('*/*'):
+			if entry.name.startswith('.') or not entry.is_dir():
+				continue
+
+			size = sum(file.stat().st_size for file in entry.iterdir())
+			entries.append((entry.stat().st_mtime, size, entry))
+			total += size
+
+		for _, size, entry in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			shutil.rmtree(entry, ignore_errors=True)
+			total -= size
+
+	def clear(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,127 @@
+from pathlib import Path
+from dataclasses import dataclass, field
+import hashlib
+import json
+import re
+
+
+UNIT_BEGIN = '%% rst-articles unit begin: '
+UNIT_END = '%% rst-articles unit end: '
+
+units_dir_name = 'units'
+state_file_name = '.state.json'
+
+unit_pattern = re.compile(
+	rf'^{re.escape(UNIT_BEGIN)}(?P<docname>[^\n]+)\n'
+	rf'(?P<body>.*?)'
+	rf'^{re.escape(UNIT_END)}(?P=docname)\n',
+	re.MULTILINE | re.DOTALL,
+)
+unsafe_name_pattern = re.compile(r'[^\w/-]')
+
+
+def _digest(content: str) -> str:
+	return hashlib.sha256(content.encode()).hexdigest()
+
+
+@dataclass
+class UnitSplit:
+	'''Result of splitting ``doc.tex`` into ``\\include``d units.
+
+	Only the digests of the last successful compile are kept, so a failed
+	LaTeX run is retried on the next build.
+	'''
+
+	build_dir: Path
+	main_digest: str
+	# include name -> digest, in document order
+	units: dict[str, str] = field(default_factory=dict)
+	previous: dict = field(default_factory=dict)
+
+	@property
+	def units_dir(self) -> Path:
+		return self.build_dir / units_dir_name
+
+	@property
+	def changed(self) -> list[str]:
+		previous_units = self.previous.get('units', {})
+		return [
+			name
+			for name, digest in self.units.items()
+			if previous_units.get(name) != digest
+		]
+
+	@property
+	def needs_full_compile(self) -> bool:
+		return (
+			self.previous.get('main') != self.main_digest or  # noqa: W504
+			self.previous.get('units', {}).keys() != self.units.keys() or  # noqa: W504
+			not all(
+				(self.units_dir / f"{name}.aux").exists()
+				for name in self.units
+			) or  # noqa: W504
+			(not self.changed and not self.previous.get('complete'))
+		)
+
+	@property
+	def up_to_date(self) -> bool:
+		return not self.changed and not self.needs_full_compile
+
+	def includeonly(self) -> str:
+		units = ','.join(f"{units_dir_name}/{name}" for name in self.changed)
+		return rf'\includeonly{{{units}}}'
+
+	def commit(self, *, complete: bool):
+		state = {
+			'main': self.main_digest,
+			'units': self.units,
+			'complete': complete,
+		}
+		(self.units_dir / state_file_name).write_text(json.dumps(state))
+
+
+def split_units(tex_file: Path) -> UnitSplit:
+	'''Moves every marked toctree document of ``tex_file`` to its own file.
+
+	Unit files are only rewritten when their content changed, and the main
+	file includes them with ``\\include``.
+	'''
+
+	build_dir = tex_file.parent
+	units_dir = build_dir / units_dir_name
+	units_dir.mkdir(parents=True, exist_ok=True)
+
+	try:
+		previous = json.loads((units_dir / state_file_name).read_text())
+	except (OSError, ValueError):
+		previous = {}
+
+	text = tex_file.read_text()
+	main = []
+	units = {}
+	position = 0
+
+	for match in unit_pattern.finditer(text):
+		name = unsafe_name_pattern.sub('_', match['docname'])
+		body = match['body']
+
+		unit_file = units_dir / f"{name}.tex"
+		unit_file.parent.mkdir(parents=True, exist_ok=True)
+		if not unit_file.exists() or unit_file.read_text() != body:
+			unit_file.write_text(body)
+
+		units[name] = _digest(body)
+		main.append(text[position:match.start()])
+		main.append(f"\\include{{{units_dir_name}/{name}}}\n")
+		position = match.end()
+
+	main.append(text[position:])
+	main = "".join(main)
+	tex_file.write_text(main)
+
+	return UnitSplit(
+		build_dir=build_dir,
+		main_digest=_digest(main),
+		units=units,
+		previous=previous,
+	)
@@ -0,0 +1,202 @@
+from typing import Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+import subprocess
+import tempfile
+import hashlib
+import shutil
+import os
+
+from rst_articles.defaults import default_cache_dir
+
+
+ghostscript_command = (
+	'-sDEVICE=pdfwrite',
+	'-dNOPAUSE',
+	'-dBATCH',
+	'-dQUIET',
+	'-dSAFER',
+	'-dCompatibilityLevel=1.7',
+	'-dDetectDuplicateImages=true',
+	'-dCompressFonts=true',
+	'-dSubsetFonts=true',
+	'-dEmbedAllFonts=true',
+	'-dCompressPages=true',
+	'-dAutoRotatePages=/None',
+)
+qpdf_command = (
+	'--linearize',
+	'--object-streams=generate',
+	'--compress-streams=y',
+	'--recompress-flate',
+	'--compression-level=9',
+)
+
+
+def _size(size: float) -> str:
+	for unit in ('B', 'KiB', 'MiB'):
+		if size < 1024:
+			return f"{size:.1f} {unit}"
+		size /= 1024
+	return f"{size:.1f} GiB"
+
+
+@dataclass
+class PDFOptimization:
+	size_before: int
+	size_after: int
+	cached: bool = field(default=False)
+	tools: tuple[str, ...] = field(default=())
+
+	def __str__(self):
+		change = self.size_after / self.size_before - 1 if self.size_before else 0
+		tools = ', '.join(self.tools) or 'no tools'
+		cached = ', cached' if self.cached else ''
+		return (
+			f"{_size(self.size_before)} -> {_size(self.size_after)} "
+			f"({change:+.0%}; {tools}{cached})"
+		)
+
+
+@dataclass
+class PDFOptimizer:
+	'''Recompresses, deduplicates and linearizes PDFs.
+
+	Ghostscript rewrites the file, merging identical images and subsetting
+	and compressing fonts; qpdf then recompresses the streams into object
+	streams and linearizes it, so viewers can show the first page before
+	the download finishes. Either tool is skipped when not installed.
+	Results are cached by the digest of the input, and the least recently
+	used ones are evicted once the directory grows past ``max_bytes``.
+	'''
+
+	directory: Path = field(default=default_cache_dir / 'pdf')
+	ghostscript: bool = field(default=True)
+	linearize: bool = field(default=True)
+	max_bytes: int = field(default=512 * 1024 ** 2)
+
+	@property
+	def tools(self) -> tuple[str, ...]:
+		tools = []
+		if self.ghostscript and shutil.which('gs'):
+			tools.append('gs')
+		if self.linearize and shutil.which('qpdf'):
+			tools.append('qpdf')
+		return tuple(tools)
+
+	def key(self, pdf: Path) -> str:
+		hasher = hashlib.sha256(f"{self.tools}\n".encode())
+		with pdf.open('rb') as file:
+			hasher.update(hashlib.file_digest(file, 'sha256').digest())
+		return hasher.hexdigest()
+
+	def optimize(
+		self,
+		pdf: Path,
+		target: Optional[Path] = None,
+	) -> PDFOptimization:
+		'''Writes the optimized ``pdf`` to ``target``, in place by default.'''
+
+		if target is None:
+			target = pdf
+
+		tools = self.tools
+		size_before = pdf.stat().st_size
+		if not tools:
+			if target != pdf:
+				shutil.copy2(pdf, target)
+			return PDFOptimization(size_before=size_before, size_after=size_before)
+
+		entry = self.directory / f"{self.key(pdf)}.pdf"
+
+		if entry.is_file():
+			shutil.copy2(entry, target)
+			os.utime(entry)
+			return PDFOptimization(
+				size_before=size_before,
+				size_after=target.stat().st_size,
+				cached=True,
+				tools=tools,
+			)
+
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			current = pdf
+
+			if 'gs' in tools:
+				rewritten = Path(tmp_dir) / 'gs.pdf'
+				subprocess.run(
+					[
+						'gs',
+						*ghostscript_command,
+						f"-sOutputFile={rewritten}",
+						current,
+					],
+					check=True,
+					capture_output=True,
+				)
+				# Ghostscript can grow files that were already compact
+				if rewritten.stat().st_size < current.stat().st_size:
+					current = rewritten
+
+			if 'qpdf' in tools:
+				linearized = Path(tmp_dir) / 'qpdf.pdf'
+				result = subprocess.run(
+					['qpdf', *qpdf_command, current, linearized],
+					capture_output=True,
+				)
+				# Exit code 3 only reports warnings
+				if result.returncode not in (0, 3):
+					raise subprocess.CalledProcessError(
+						result.returncode,
+						result.args,
+						result.stdout,
+						result.stderr,
+					)
+				current = linearized
+
+			self.directory.mkdir(parents=True, exist_ok=True)
+			fd, staged = tempfile.mkstemp(dir=self.directory, prefix='.')
+			os.close(fd)
+			shutil.copy2(current, staged)
+			os.replace(staged, entry)
+
+		# Optimizing the output again is a cache hit as well. A hard link,
+		# so the file is stored once and both keys share their LRU time
+		alias = self.directory / f"{self.key(entry)}.pdf"
+		if not alias.exists():
+			try:
+				os.link(entry, alias)
+			except OSError:
+				pass
+
+		shutil.copy2(entry, target)
+		self.evict()
+		return PDFOptimization(
+			size_before=size_before,
+			size_after=target.stat().st_size,
+			tools=tools,
+		)
+
+	def evict(self):
+		# Hard linked aliases are one file
+		files = {}
+		for entry in self.directory.glob('*.pdf'):
+			try:
+				stat = entry.stat()
+			except OSError:
+				continue
+			files.setdefault(
+				(stat.st_dev, stat.st_ino),
+				(stat.st_mtime, stat.st_size, []),
+			)[2].append(entry)
+
+		total = sum(size for _, size, _ in files.values())
+		for _, size, entries in sorted(files.values()):
+			if total <= self.max_bytes:
+				break
+			for entry in entries:
+				entry.unlink(missing_ok=True)
+			total -= size
+
+	def clear(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
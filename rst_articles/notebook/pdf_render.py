@@ -0,0 +1,103 @@
+from pathlib import Path
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+import io
+
+try:
+	from pdf2image import convert_from_path, pdfinfo_from_path
+except ImportError:
+	convert_from_path = None
+	pdfinfo_from_path = None
+
+try:
+	import ipywidgets
+except ImportError:
+	ipywidgets = None
+
+
+# Name accepted by IPython.display.Image -> Pillow format
+image_formats = {
+	'webp': 'WEBP',
+	'jpeg': 'JPEG',
+	'png': 'PNG',
+}
+
+
+def page_count(pdf: Path) -> int:
+	return pdfinfo_from_path(pdf)['Pages']
+
+
+def render_page(
+	pdf: Path,
+	page: int,
+	*,
+	max_size: int,
+	image_format: str,
+	quality: int,
+) -> bytes:
+	'''Renders the 0-based ``page`` of ``pdf`` as an encoded image.
+
+	Poppler rasterizes the page with its longest side at ``max_size``
+	pixels, so a single page is held in memory at a time.
+	'''
+
+	image, = convert_from_path(
+		pdf,
+		first_page=page + 1,
+		last_page=page + 1,
+		size=max_size,
+	)
+	try:
+		if image_format == 'jpeg':
+			image = image.convert('RGB')
+
+		encoded = io.BytesIO()
+		image.save(encoded, format=image_formats[image_format], quality=quality)
+	finally:
+		image.close()
+
+	return encoded.getvalue()
+
+
+@dataclass
+class PageViewer:
+	'''Notebook widget showing one page of a PDF at a time.
+
+	Pages are rendered when they are looked at, and only the last
+	``cached_pages`` of them are kept.
+	'''
+
+	pdf: Path
+	max_size: int
+	image_format: str
+	quality: int
+	cached_pages: int = field(default=8)
+
+	def __post_init__(self):
+		self.pages = page_count(self.pdf)
+		self.render = lru_cache(maxsize=self.cached_pages)(partial(
+			render_page,
+			self.pdf,
+			max_size=self.max_size,
+			image_format=self.image_format,
+			quality=self.quality,
+		))
+
+	def widget(self, page: int = 0):
+		slider = ipywidgets.IntSlider(
+			value=page + 1,
+			min=1,
+			max=self.pages,
+			description='Page',
+			continuous_update=False,
+		)
+		image = ipywidgets.Image(
+			value=self.render(page),
+			format=self.image_format,
+		)
+
+		def show(change):
+			image.value = self.render(change['new'] - 1)
+
+		slider.observe(show, names='value')
+		return ipywidgets.VBox([slider, image])
@@ -0,0 +1,220 @@
+from typing import Iterable, Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+import re
+
+from rst_articles.notebook.bibliography import (
+	cite_role_pattern,
+	citation_reference_pattern,
+	first_cite_role_pattern,
+	full_suffix,
+	split_entries,
+)
+
+
+directive_pattern = re.compile(r'^\s*\.\. ([\w-]+)::\s*(.*?)\s*$')
+name_option_pattern = re.compile(r'^\s+:name:\s*(.+?)\s*$')
+label_pattern = re.compile(r'^\s*\.\. _([^_:][^:]*):\s*$')
+citation_pattern = re.compile(r'^\s*\.\. \[([^\]\s#*]+)\]')
+
+abbrev_role_pattern = re.compile(r':abbrev:`([^`]+)`')
+ref_role_pattern = re.compile(
+	r':(?:ref|numref):`(?:[^`<]*<([^>`]+)>|([^`]+))`'
+)
+
+
+def normalize_name(name: str) -> str:
+	# Same as docutils for reference names
+	return ' '.join(name.lower().split())
+
+
+@dataclass(frozen=True)
+class Reference:
+	kind: str
+	key: str
+	line: int
+
+	def __str__(self):
+		return f"{self.line} | unresolved {self.kind} \"{self.key}\""
+
+
+@dataclass
+class FileEntries:
+	definitions: set[str] = field(default_factory=set)
+	labels: set[str] = field(default_factory=set)
+	figures: set[str] = field(default_factory=set)
+	citations: set[str] = field(default_factory=set)
+	references: list[Reference] = field(default_factory=list)
+
+
+def scan_rst(content: str) -> FileEntries:
+	entries = FileEntries()
+	directive = None
+
+	for line_number, line in enumerate(content.split('\n'), start=1):
+		if match := directive_pattern.match(line):
+			directive = match[1]
+			if directive == 'new-def' and match[2]:
+				entries.definitions.add(match[2])
+		elif match := name_option_pattern.match(line):
+			name = normalize_name(match[1])
+			if directive == 'floating-figure':
+				entries.figures.add(name)
+			else:
+				entries.labels.add(name)
+		elif line.strip() and not line[0].isspace():
+			directive = None
+
+		if match := label_pattern.match(line):
+			entries.labels.add(normalize_name(match[1]))
+		if match := citation_pattern.match(line):
+			entries.citations.add(match[1].lower())
+
+		for match in abbrev_role_pattern.finditer(line):
+			entries.references.append(Reference('abbrev', match[1], line_number))
+		for match in ref_role_pattern.finditer(line):
+			entries.references.append(
+				Reference('ref', match[1] or match[2], line_number)
+			)
+		for match in cite_role_pattern.finditer(line):
+			entries.references.extend(
+				Reference('citation', key.strip(), line_number)
+				for key in match[1].split(',')
+				if key.strip()
+			)
+		for match in first_cite_role_pattern.finditer(line):
+			entries.references.append(
+				Reference('citation', match[1].strip(), line_number)
+			)
+		for match in citation_reference_pattern.finditer(line):
+			if not (match[1].isdigit() or match[1][0] in '#*'):
+				entries.references.append(
+					Reference('citation', match[1], line_number)
+				)
+
+	return entries
+
+
+@dataclass
+class ProjectIndex:
+	'''Definitions, bibliography keys, figure names and labels of a project.
+
+	Files are rescanned one at a time as they are written, so unresolved
+	``:abbrev:``, citation and ``:ref:`` references are found without a
+	build.
+	'''
+
+	source_dir: Path
+	files: dict[Path, FileEntries] = field(default_factory=dict)
+	# .bib file -> lowercased keys
+	bibliographies: dict[Path, set[str]] = field(default_factory=dict)
+	# Modification times of the indexed files, see refresh()
+	mtimes: dict[Path, int] = field(default_factory=dict)
+
+	@classmethod
+	def scan(cls, source_dir: Path) -> 'ProjectIndex':
+		index = cls(source_dir=source_dir)
+		index.refresh()
+		return index
+
+	def refresh(self):
+		'''Rescans the files changed on disk since they were indexed.'''
+
+		found = set()
+		for path in self.source_dir.rglob('*'):
+			if path.suffix not in ('.rst', '.bib') or not path.is_file():
+				continue
+
+			found.add(path)
+			if self.mtimes.get(path) != path.stat().st_mtime_ns:
+				self.update(path, path.read_text(errors='replace'))
+
+		for path in set(self.mtimes) - found:
+			self.remove(path)
+
+	def update(self, path: Path, content: str):
+		if path.suffix == '.rst':
+			self.files[path] = scan_rst(content)
+		elif path.suffix == '.bib':
+			self.bibliographies[path] = {
+				key.lower()
+				for _, key, _ in split_entries(content)
+				if key is not None
+			}
+		else:
+			return
+
+		try:
+			self.mtimes[path] = path.stat().st_mtime_ns
+		except OSError:
+			self.mtimes.pop(path, None)
+
+	def remove(self, path: Path):
+		self.files.pop(path, None)
+		self.bibliographies.pop(path, None)
+		self.mtimes.pop(path, None)
+
+	@property
+	def definitions(self) -> set[str]:
+		return set().union(*(
+			entries.definitions
+			for entries in self.files.values()
+		))
+
+	@property
+	def targets(self) -> set[str]:
+		return set().union(*(
+			entries.labels | entries.figures
+			for entries in self.files.values()
+		))
+
+	@property
+	def citation_keys(self) -> set[str]:
+		# A cited-only project cites from the full file, not the pruned one
+		full = [
+			keys
+			for path, keys in self.bibliographies.items()
+			if path.name.endswith(full_suffix)
+		]
+		return set().union(
+			*(full or self.bibliographies.values()),
+			*(entries.citations for entries in self.files.values()),
+		)
+
+	def cited_keys(self) -> set[str]:
+		return {
+			reference.key
+			for entries in self.files.values()
+			for reference in entries.references
+			if reference.kind == 'citation'
+		}
+
+	def unresolved(
+		self,
+		paths: Optional[Iterable[Path]] = None,
+	) -> dict[Path, list[Reference]]:
+		if paths is None:
+			paths = self.files
+
+		definitions = self.definitions
+		targets = self.targets
+		citation_keys = self.citation_keys
+
+		unresolved = {}
+		for path in paths:
+			entries = self.files.get(path)
+			if entries is None:
+				continue
+
+			for reference in entries.references:
+				if reference.kind == 'abbrev':
+					resolved = reference.key in definitions
+				elif reference.kind == 'ref':
+					resolved = normalize_name(reference.key) in targets
+				else:
+					resolved = reference.key.lower() in citation_keys
+
+				if not resolved:
+					unresolved.setdefault(path, []).append(reference)
+
+		return unresolved
@@ -0,0 +1,261 @@
+from typing import Callable, Iterable, Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+from collections import deque
+import subprocess
+import threading
+import signal
+import queue
+import os
+import re
+
+
+sphinx_message_pattern = re.compile(
+	r'^(?:(?P<location>.+?):(?:(?P<line>\d+):)? )?'
+	r'(?P<level>WARNING|ERROR|SEVERE|CRITICAL): (?P<message>.*)$'
+)
+latex_file_error_pattern = re.compile(
+	r'^(?P<location>[^\s:]+\.tex):(?P<line>\d+): (?P<message>.*)$'
+)
+latex_error_line_pattern = re.compile(r'^l\.(?P<line>\d+)')
+latex_box_pattern = re.compile(
+	r'^(?P<kind>Overfull|Underfull) \\[hv]box .*?'
+	r'(?:lines? (?P<line>\d+)(?:--\d+)?)?$'
+)
+latex_warning_pattern = re.compile(
+	r'^(?:LaTeX|Package \S+|Class \S+) Warning: (?P<message>.*?)'
+	r'(?: on input line (?P<line>\d+)\.)?$'
+)
+
+error_levels = {'error', 'severe', 'critical'}
+
+
+@dataclass
+class BuildMessage:
+	tool: str
+	level: str
+	message: str
+	location: Optional[str] = None
+	line: Optional[int] = None
+
+	@property
+	def is_error(self) -> bool:
+		return self.level in error_levels
+
+	def __str__(self):
+		where = self.location or self.tool
+		if self.line is not None:
+			where = f"{where}:{self.line}"
+		return f"{where}: {self.level.upper()}: {self.message}"
+
+
+class SphinxLogParser:
+	tool = 'sphinx'
+
+	def feed(self, line: str) -> Optional[BuildMessage]:
+		match = sphinx_message_pattern.match(line)
+		if match is None:
+			return None
+
+		return BuildMessage(
+			tool=self.tool,
+			level=match['level'].lower(),
+			message=match['message'],
+			location=match['location'],
+			line=int(match['line']) if match['line'] else None,
+		)
+
+
+class LaTeXLogParser:
+	tool = 'latex'
+
+	def __init__(self):
+		self._pending: Optional[BuildMessage] = None
+		self._seen: set[tuple] = set()
+
+	def feed(self, line: str) -> Optional[BuildMessage]:
+		# pdflatex reports the offending line on a separate "l.<n>" line
+		# after the "!" error, so the last error is completed in place
+		if self._pending is not None:
+			match = latex_error_line_pattern.match(line)
+			if match is not None:
+				self._pending.line = int(match['line'])
+				self._pending = None
+				return None
+
+		message = self._parse(line)
+		if message is None:
+			return None
+
+		# latexmk runs several passes that repeat the same diagnostics
+		key = (message.level, message.message, message.line)
+		if key in self._seen:
+			return None
+		self._seen.add(key)
+
+		return message
+
+	def _parse(self, line: str) -> Optional[BuildMessage]:
+		if line.startswith('! '):
+			self._pending = BuildMessage(
+				tool=self.tool,
+				level='error',
+				message=line[2:].strip(),
+			)
+			return self._pending
+
+		match = latex_file_error_pattern.match(line)
+		if match is not None:
+			return BuildMessage(
+				tool=self.tool,
+				level='error',
+				message=match['message'],
+				location=match['location'],
+				line=int(match['line']),
+			)
+
+		match = latex_box_pattern.match(line)
+		if match is not None:
+			return BuildMessage(
+				tool=self.tool,
+				level=match['kind'].lower(),
+				message=line.strip(),
+				line=int(match['line']) if match['line'] else None,
+			)
+
+		match = latex_warning_pattern.match(line)
+		if match is not None:
+			return BuildMessage(
+				tool=self.tool,
+				level='warning',
+				message=match['message'],
+				line=int(match['line']) if match['line'] else None,
+			)
+
+		return None
+
+
+@dataclass
+class RunResult:
+	returncode: int
+	stdout: deque = field(default_factory=deque)
+	stderr: deque = field(default_factory=deque)
+	messages: list[BuildMessage] = field(default_factory=list)
+	aborted: bool = False
+
+
+def _pump(stream, name: str, lines: queue.Queue):
+	try:
+		for line in stream:
+			lines.put((name, line.rstrip('\n')))
+	finally:
+		lines.put((name, None))
+
+
+def _terminate(process: subprocess.Popen):
+	'''Stops ``process`` and its children, which hold the output pipes.
+
+	make and sphinx-build start latexmk and pdflatex, so only signalling
+	the direct child would still wait for them to close the pipes.
+	'''
+
+	try:
+		os.killpg(process.pid, signal.SIGTERM)
+	except ProcessLookupError:
+		pass
+
+
+def run_streaming(
+	command: Iterable[str | Path],
+	*,
+	parser,
+	cwd: Optional[Path] = None,
+	env: Optional[dict[str, str]] = None,
+	on_output: Optional[Callable[[str], None]] = None,
+	on_message: Optional[Callable[[BuildMessage], None]] = None,
+	should_abort: Optional[Callable[[BuildMessage], bool]] = None,
+	cancelled: Optional[threading.Event] = None,
+	max_lines: int = 2000,
+) -> RunResult:
+	process = subprocess.Popen(
+		list(map(str, command)),
+		cwd=cwd,
+		env=env,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+		text=True,
+		errors='replace',
+		bufsize=1,
+		# Its own process group, see _terminate()
+		start_new_session=True,
+	)
+
+	result = RunResult(
+		returncode=0,
+		stdout=deque(maxlen=max_lines),
+		stderr=deque(maxlen=max_lines),
+	)
+
+	lines = queue.Queue()
+	pumps = [
+		threading.Thread(
+			target=_pump,
+			args=(getattr(process, name), name, lines),
+			daemon=True,
+		)
+		for name in ('stdout', 'stderr')
+	]
+	for pump in pumps:
+		pump.start()
+
+	open_streams = len(pumps)
+	while open_streams:
+		if (
+			not result.aborted and  # noqa: W504
+			cancelled is not None and  # noqa: W504
+			cancelled.is_set()
+		):
+			result.aborted = True
+			_terminate(process)
+
+		try:
+			name, line = lines.get(timeout=0.2)
+		except queue.Empty:
+			continue
+
+		if line is None:
+			open_streams -= 1
+			continue
+
+		getattr(result, name).append(line)
+
+		if on_output is not None:
+			on_output(line)
+
+		message = parser.feed(line)
+		if message is None:
+			continue
+
+		result.messages.append(message)
+
+		if on_message is not None:
+			on_message(message)
+
+		if (
+			not result.aborted and  # noqa: W504
+			should_abort is not None and  # noqa: W504
+			should_abort(message)
+		):
+			result.aborted = True
+			_terminate(process)
+
+	for pump in pumps:
+		pump.join()
+
+	result.returncode = process.wait()
+	return result
+
+
+def tail_file(path: Path, max_lines: int = 2000) -> deque:
+	with path.open(errors='replace') as file:
+		return deque((line.rstrip('\n') for line in file), maxlen=max_lines)
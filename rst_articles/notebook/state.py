@@ -0,0 +1,213 @@
+from typing import Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+import tempfile
+import tarfile
+import hashlib
+import shutil
+import json
+import io
+import os
+
+
+manifest_name = 'manifest.json'
+objects_dir_name = 'objects'
+state_version = 1
+
+
+def file_digest(path: Path) -> str:
+	with path.open('rb') as file:
+		return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def _tree(root: Path) -> dict[str, list]:
+	'''Relative path -> ``[digest, mtime_ns]`` of the files under ``root``.'''
+
+	tree = {}
+	if not root.is_dir():
+		return tree
+
+	for path in sorted(root.rglob('*')):
+		if not path.is_file() or '__pycache__' in path.parts:
+			continue
+
+		tree[path.relative_to(root).as_posix()] = [
+			file_digest(path),
+			path.stat().st_mtime_ns,
+		]
+	return tree
+
+
+def _safe_path(root: Path, name: str) -> Path:
+	relative = Path(name)
+	if relative.is_absolute() or '..' in relative.parts:
+		raise ValueError(f"Unsafe path in state archive: {name}")
+	return root / relative
+
+
+@dataclass
+class RestoredState:
+	files: int
+	size: int
+	# Digests and modification times of the sources the state was built
+	# from, see Article.restore_state()
+	sources: dict[str, list] = field(default_factory=dict)
+
+	def __str__(self):
+		return f"{self.files} files ({self.size / 1024 ** 2:.1f} MiB)"
+
+
+@dataclass
+class StateArchive:
+	'''Compressed, content-addressed snapshot of build directories.
+
+	Each distinct file is stored once under ``objects/<digest>``. The
+	manifest maps every file of every root to its digest and modification
+	time, and records the digests of the sources the state was built from.
+	'''
+
+	path: Path
+	compresslevel: int = field(default=6)
+
+	def read_manifest(self) -> Optional[dict]:
+		try:
+			with tarfile.open(self.path, 'r:gz') as archive:
+				member = archive.next()
+				if member is None or member.name != manifest_name:
+					return None
+				return json.load(archive.extractfile(member))
+		except (OSError, tarfile.TarError, json.JSONDecodeError):
+			return None
+
+	def save(self, roots: dict[str, Path], *, source_dir: Path) -> bool:
+		'''Archives ``roots``, returns whether the archive was rewritten.'''
+
+		manifest = {
+			'version': state_version,
+			'sources': _tree(source_dir),
+			'roots': {name: _tree(root) for name, root in roots.items()},
+		}
+		if self.read_manifest() == manifest:
+			return False
+
+		objects = {}
+		for name, tree in manifest['roots'].items():
+			for relative, (digest, _) in tree.items():
+				objects.setdefault(digest, roots[name] / relative)
+
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		fd, tmp = tempfile.mkstemp(
+			dir=self.path.parent,
+			prefix=f".{self.path.name}.",
+		)
+		os.close(fd)
+		try:
+			with tarfile.open(
+				tmp,
+				'w:gz',
+				compresslevel=self.compresslevel,
+			) as archive:
+				# First, so the manifest is read without scanning the objects
+				data = json.dumps(manifest, sort_keys=True).encode()
+				info = tarfile.TarInfo(manifest_name)
+				info.size = len(data)
+				archive.addfile(info, io.BytesIO(data))
+
+				# Through the opened file, so symlinks store their contents
+				for digest, path in objects.items():
+					with path.open('rb') as file:
+						info = archive.gettarinfo(
+							arcname=f"{objects_dir_name}/{digest}",
+							fileobj=file,
+						)
+						archive.addfile(info, file)
+			os.replace(tmp, self.path)
+		except BaseException:
+			os.unlink(tmp)
+			raise
+
+		return True
+
+	def restore(self, roots: dict[str, Path]) -> RestoredState:
+		'''Extracts the files of ``roots`` and verifies their digests.
+
+		No file is replaced unless the archive holds all of them intact.
+		'''
+
+		with tarfile.open(self.path, 'r:gz') as archive:
+			member = archive.next()
+			if member is None or member.name != manifest_name:
+				raise ValueError(f"Not a state archive: {self.path}")
+
+			manifest = json.load(archive.extractfile(member))
+			if manifest.get('version') != state_version:
+				raise ValueError(
+					f"Unsupported state archive version: {manifest.get('version')}"
+				)
+
+			# digest -> [(path, mtime_ns)]
+			targets = {}
+			for name, tree in manifest['roots'].items():
+				if name not in roots:
+					continue
+				for relative, (digest, mtime) in tree.items():
+					targets.setdefault(digest, []).append(
+						(_safe_path(roots[name], relative), mtime)
+					)
+
+			members = {
+				member.name.rpartition('/')[2]: member
+				for member in archive
+				if member.isfile()
+			}
+			if targets.keys() - members.keys():
+				raise ValueError(f"Incomplete state archive: {self.path}")
+
+			restored = RestoredState(
+				files=0,
+				size=0,
+				sources=manifest['sources'],
+			)
+			# Files are only moved into place once every object was verified
+			staged = []
+			try:
+				for digest in sorted(targets, key=lambda d: members[d].offset):
+					member = members[digest]
+					copies = []
+					for path, mtime in targets[digest]:
+						path.parent.mkdir(parents=True, exist_ok=True)
+						fd, tmp = tempfile.mkstemp(
+							dir=path.parent,
+							prefix=f".{path.name}.",
+						)
+						os.close(fd)
+						staged.append((tmp, path, mtime, member.mode))
+						copies.append(tmp)
+
+					first, *others = copies
+					hasher = hashlib.sha256()
+					source = archive.extractfile(member)
+					with open(first, 'wb') as file:
+						while chunk := source.read(1024 ** 2):
+							hasher.update(chunk)
+							file.write(chunk)
+
+					if hasher.hexdigest() != digest:
+						raise ValueError(f"Corrupt state archive: {self.path}")
+
+					for tmp in others:
+						shutil.copyfile(first, tmp)
+
+					restored.files += len(copies)
+					restored.size += member.size * len(copies)
+			except BaseException:
+				for tmp, _, _, _ in staged:
+					os.unlink(tmp)
+				raise
+
+		for tmp, path, mtime, mode in staged:
+			os.chmod(tmp, mode & 0o777)
+			os.utime(tmp, ns=(mtime, mtime))
+			os.replace(tmp, path)
+
+		return restored
@@ -0,0 +1,125 @@
+from typing import Callable
+from pathlib import Path
+from dataclasses import dataclass
+import re
+
+
+field_pattern = re.compile(r'___1_\{(\w+)\}___')
+
+latex_special_characters = {
+	'\\': r'\textbackslash{}',
+	'&': r'\&',
+	'%': r'\%',
+	'$': r'\$',
+	'#': r'\#',
+	'_': r'\_',
+	'{': r'\{',
+	'}': r'\}',
+	'~': r'\textasciitilde{}',
+	'^': r'\textasciicircum{}',
+}
+
+
+def latex_escape(text: str) -> str:
+	return ''.join(latex_special_characters.get(char, char) for char in text)
+
+
+def python_literal(value) -> str:
+	'''Renders ``value`` as a Python literal, for ``conf.py``.'''
+
+	if value is None or isinstance(value, (bool, int, float, str)):
+		return repr(value)
+
+	if isinstance(value, Path):
+		return repr(str(value))
+
+	if isinstance(value, (list, tuple, set, frozenset)):
+		# Sets are sorted so the same values always render the same file
+		if isinstance(value, (set, frozenset)):
+			value = sorted(value)
+		return "[\n" + "".join(
+			f"\t{python_literal(item)},\n"
+			for item in value
+		) + "]"
+
+	raise TypeError(f"Cannot render a {type(value).__name__} in conf.py")
+
+
+def rst_text(value) -> str:
+	'''Renders ``value`` as reStructuredText lines, one per item.'''
+
+	if isinstance(value, (list, tuple)):
+		return "\n".join(rst_text(item) for item in value)
+
+	text = str(value)
+	if not text.strip() or '\n' in text:
+		raise ValueError(f"Expected a single non-empty line, got {text!r}")
+	return text
+
+
+def plain_text(value) -> str:
+	return str(value)
+
+
+@dataclass(frozen=True)
+class Template:
+	'''Template text compiled once into literal parts and fields.
+
+	Fields are written ``___1_{name}___``, and their values go through
+	``render_value``, which validates and escapes them. Lines after the
+	first of a value are indented like the line of its field.
+	'''
+
+	# Literal text, then (field, indent, literal text) for every field
+	head: str
+	fields: tuple[tuple[str, str, str], ...]
+	render_value: Callable[[object], str]
+
+	@classmethod
+	def compile(
+		cls,
+		text: str,
+		render_value: Callable[[object], str] = plain_text,
+	) -> 'Template':
+		parts = field_pattern.split(text)
+
+		fields = []
+		for index in range(1, len(parts), 2):
+			line = parts[index - 1].rpartition('\n')[2]
+			indent = line[:len(line) - len(line.lstrip())]
+			fields.append((parts[index], indent, parts[index + 1]))
+
+		return cls(
+			head=parts[0],
+			fields=tuple(fields),
+			render_value=render_value,
+		)
+
+	@classmethod
+	def load(
+		cls,
+		path: Path,
+		render_value: Callable[[object], str] = plain_text,
+	) -> 'Template':
+		return cls.compile(path.read_text(), render_value)
+
+	@property
+	def names(self) -> set[str]:
+		return {name for name, _, _ in self.fields}
+
+	def render(self, **values) -> str:
+		if missing := self.names - values.keys():
+			raise KeyError(f"Missing template fields: {', '.join(sorted(missing))}")
+		if unknown := values.keys() - self.names:
+			raise KeyError(f"Unknown template fields: {', '.join(sorted(unknown))}")
+
+		rendered = {
+			name: self.render_value(value)
+			for name, value in values.items()
+		}
+
+		text = [self.head]
+		for name, indent, literal in self.fields:
+			text.append(rendered[name].replace('\n', f"\n{indent}"))
+			text.append(literal)
+		return "".join(text)
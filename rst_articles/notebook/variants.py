@@ -0,0 +1,41 @@
+from typing import Optional
+from dataclasses import dataclass, field
+import json
+import re
+
+
+variants_dir_name = 'variants'
+# Read by conf.py, see templates/conf.py
+variant_env_var = 'RST_ARTICLES_VARIANT'
+
+variant_name_pattern = re.compile(r'[\w.-]+')
+
+
+@dataclass
+class Variant:
+	'''One PDF of a multi-variant build, see ``Article.build``.
+
+	Variants share the documents Sphinx reads, so they may only change
+	what the LaTeX writer and LaTeX see: the color scheme and
+	``latex_elements``.
+	'''
+
+	name: str
+	dark: Optional[bool] = field(default=None)
+	papersize: Optional[str] = field(default=None)
+	latex_elements: dict[str, str] = field(default_factory=dict)
+
+	def __post_init__(self):
+		assert variant_name_pattern.fullmatch(self.name), "Invalid variant name"
+		assert self.dark in (None, True, False), "Dark mode must be a boolean"
+
+	def overrides(self) -> str:
+		elements = dict(self.latex_elements)
+		if self.papersize is not None:
+			elements['papersize'] = self.papersize
+
+		overrides = {'latex_elements': elements}
+		if self.dark is not None:
+			overrides['dark'] = self.dark
+
+		return json.dumps(overrides, sort_keys=True)
@@ -0,0 +1,139 @@
+from typing import Callable, Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+import threading
+import tempfile
+import shutil
+import os
+
+from rst_articles.notebook.latex_units import units_dir_name
+from rst_articles.notebook.variants import variants_dir_name
+
+
+memory_roots = (
+	Path('/dev/shm'),
+)
+
+# Copied back to the build directory after a successful build, and into
+# the workspace before the next one so LaTeX reruns stay incremental
+persistent_files = (
+	'doc.pdf',
+	'doc.tex',
+	'doc.log',
+	'doc.aux',
+	'doc.toc',
+	'doc.fdb_latexmk',
+)
+persistent_dirs = (
+	units_dir_name,
+	# The Sphinx environments, so incremental reads survive the workspace
+	'.doctrees',
+	f"{variants_dir_name}/.doctrees",
+)
+
+
+def directory_size(path: Path) -> int:
+	size = 0
+	for root, _, files in os.walk(path):
+		for name in files:
+			try:
+				size += os.lstat(os.path.join(root, name)).st_size
+			except OSError:
+				pass
+	return size
+
+
+def _copy_state(source: Path, target: Path):
+	for name in persistent_files:
+		if (source / name).is_file():
+			shutil.copy2(source / name, target / name)
+
+	for name in persistent_dirs:
+		if (source / name).is_dir():
+			shutil.copytree(source / name, target / name, dirs_exist_ok=True)
+
+	# Each variant keeps the state of its own LaTeX tree
+	for variant in (source / variants_dir_name).glob('*/'):
+		if variant.name.startswith('.'):
+			continue
+		variant_target = target / variants_dir_name / variant.name
+		variant_target.mkdir(parents=True, exist_ok=True)
+		_copy_state(variant, variant_target)
+
+
+@dataclass
+class MemoryWorkspace:
+	'''Temporary build directory on a RAM-backed filesystem.
+
+	Only the outputs and the state later builds reuse are copied between
+	it and the persistent build directory. ``watch`` calls back once the
+	workspace grows past ``limit`` bytes, so the build can be stopped and
+	retried on disk.
+	'''
+
+	build_dir: Path
+	path: Path
+	limit: int
+	# Below this, failed tools most likely ran out of space
+	min_free: int = field(default=16 * 1024 ** 2)
+	poll_interval: float = field(default=0.5)
+	over_limit: bool = field(default=False)
+
+	@classmethod
+	def create(
+		cls,
+		build_dir: Path,
+		*,
+		limit: int,
+	) -> Optional['MemoryWorkspace']:
+		for root in memory_roots:
+			if not (root.is_dir() and os.access(root, os.W_OK)):
+				continue
+
+			if shutil.disk_usage(root).free < limit:
+				continue
+
+			return cls(
+				build_dir=build_dir,
+				path=Path(tempfile.mkdtemp(dir=root, prefix='rst_articles-')),
+				limit=limit,
+			)
+
+		return None
+
+	@property
+	def exhausted(self) -> bool:
+		return (
+			self.over_limit or  # noqa: W504
+			shutil.disk_usage(self.path).free < self.min_free
+		)
+
+	def load(self):
+		_copy_state(self.build_dir, self.path)
+
+	def save(self):
+		self.build_dir.mkdir(parents=True, exist_ok=True)
+		_copy_state(self.path, self.build_dir)
+
+	def close(self):
+		shutil.rmtree(self.path, ignore_errors=True)
+
+	@contextmanager
+	def watch(self, on_exceeded: Callable[[], None]):
+		stopped = threading.Event()
+
+		def poll():
+			while not stopped.wait(self.poll_interval):
+				if directory_size(self.path) > self.limit:
+					self.over_limit = True
+					on_exceeded()
+					return
+
+		watcher = threading.Thread(target=poll, daemon=True)
+		watcher.start()
+		try:
+			yield self
+		finally:
+			stopped.set()
+			watcher.join()
@@ -0,0 +1,8 @@
+from .service import BuildService, Job
+from .server import serve
+
+__all__ = [
+	'BuildService',
+	'Job',
+	'serve',
+]
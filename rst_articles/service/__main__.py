@@ -0,0 +1,55 @@
+from pathlib import Path
+import argparse
+
+from rst_articles.defaults import default_cache_dir
+
+from .service import BuildService
+from .server import serve
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		prog='python -m rst_articles.service',
+		description="Local article build service",
+	)
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--socket', type=Path, help="Listen on a Unix socket")
+	parser.add_argument(
+		'--root',
+		type=Path,
+		default=default_cache_dir / 'service',
+	)
+	parser.add_argument('--workers', type=int, default=2)
+	parser.add_argument('--lang', default='en-US')
+	parser.add_argument('--draft', action='store_true')
+	parser.add_argument('--no-linter', action='store_true')
+	args = parser.parse_args()
+
+	service = BuildService(
+		root=args.root,
+		workers=args.workers,
+		enable_linter=not args.no_linter,
+		linter_lang=args.lang,
+		linter_draft=args.draft,
+	)
+	service.start()
+
+	server = serve(
+		service,
+		host=args.host,
+		port=args.port,
+		socket_path=args.socket,
+	)
+	print("Serving builds at:", args.socket or f"http://{args.host}:{args.port}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.stop()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,149 @@
+from typing import Optional
+from pathlib import Path
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import socketserver
+import json
+import os
+
+from .service import BuildService
+
+
+class BuildRequestHandler(BaseHTTPRequestHandler):
+	'''JSON API of a ``BuildService``.
+
+	- ``POST /jobs``: submits a job, see ``Job``, and returns its id
+	- ``GET /jobs``: lists the known jobs
+	- ``GET /jobs/<id>[?logs=1]``: state, output tail, messages and lint
+	- ``GET /jobs/<id>/pdf``: the PDF of a successful job
+	- ``DELETE /jobs/<id>``: cancels a queued or running job
+	'''
+
+	server_version = 'rst-articles'
+
+	@property
+	def service(self) -> BuildService:
+		return self.server.service
+
+	def address_string(self) -> str:
+		# Unix sockets have no client address
+		if isinstance(self.client_address, tuple) and self.client_address:
+			return str(self.client_address[0])
+		return 'local'
+
+	def _send_json(self, status: HTTPStatus, content):
+		body = json.dumps(content).encode()
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _send_error(self, status: HTTPStatus, message: str):
+		self._send_json(status, {'error': message})
+
+	def _route(self) -> tuple[list[str], dict]:
+		url = urlsplit(self.path)
+		return (
+			[part for part in url.path.split('/') if part],
+			parse_qs(url.query),
+		)
+
+	def do_POST(self):
+		parts, _ = self._route()
+		if parts != ['jobs']:
+			return self._send_error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+			request = json.loads(self.rfile.read(length) or b'{}')
+			job = self.service.submit(request)
+		except ValueError as e:
+			return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+
+		self._send_json(HTTPStatus.ACCEPTED, {'id': job.id, 'state': job.state})
+
+	def do_GET(self):
+		parts, query = self._route()
+
+		if parts == ['jobs']:
+			return self._send_json(HTTPStatus.OK, [
+				{
+					'id': job.id,
+					'project': job.project,
+					'priority': job.priority,
+					'state': job.state,
+				}
+				for job in list(self.service.jobs.values())
+			])
+
+		if len(parts) not in (2, 3) or parts[0] != 'jobs':
+			return self._send_error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+
+		job = self.service.get(parts[1])
+		if job is None:
+			return self._send_error(HTTPStatus.NOT_FOUND, "Unknown job")
+
+		if len(parts) == 2:
+			logs = query.get('logs', ['0'])[0] not in ('', '0', 'false')
+			return self._send_json(HTTPStatus.OK, job.status(logs=logs))
+
+		if parts[2] != 'pdf':
+			return self._send_error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+
+		if job.pdf is None or not job.pdf.exists():
+			return self._send_error(
+				HTTPStatus.CONFLICT,
+				f"No PDF, job is {job.state}",
+			)
+
+		body = job.pdf.read_bytes()
+		self.send_response(HTTPStatus.OK)
+		self.send_header('Content-Type', 'application/pdf')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_DELETE(self):
+		parts, _ = self._route()
+		if len(parts) != 2 or parts[0] != 'jobs':
+			return self._send_error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+
+		job = self.service.cancel(parts[1])
+		if job is None:
+			return self._send_error(HTTPStatus.NOT_FOUND, "Unknown job")
+
+		self._send_json(HTTPStatus.OK, {'id': job.id, 'state': job.state})
+
+
+class UnixHTTPServer(
+	socketserver.ThreadingMixIn,
+	socketserver.UnixStreamServer,
+):
+	daemon_threads = True
+
+
+def serve(
+	service: BuildService,
+	*,
+	host: str = '127.0.0.1',
+	port: int = 8765,
+	socket_path: Optional[Path] = None,
+):
+	'''Creates the server of ``service``, call ``serve_forever`` to run it.
+
+	With ``socket_path`` the API listens on a Unix socket instead of TCP,
+	so it is only reachable by local users with access to the file.
+	'''
+
+	if socket_path is not None:
+		socket_path = Path(socket_path)
+		if socket_path.exists():
+			os.unlink(socket_path)
+		server = UnixHTTPServer(str(socket_path), BuildRequestHandler)
+	else:
+		server = ThreadingHTTPServer((host, port), BuildRequestHandler)
+
+	server.service = service
+	return server
@@ -0,0 +1,440 @@
+from typing import Optional
+from pathlib import Path
+from dataclasses import dataclass, field, asdict
+from collections import deque
+import itertools
+import threading
+import shutil
+import queue
+import time
+import uuid
+import re
+
+from rst_articles.defaults import default_cache_dir
+from rst_articles.notebook.article import Article, RSTLinter
+from rst_articles.notebook.build_cache import BuildCache
+
+
+project_name_pattern = re.compile(r'\w[\w.-]*')
+style_pattern = re.compile(r'\w[\w-]*')
+
+config_fields = (
+	'project',
+	'title',
+	'subtitle',
+	'author',
+	'institution',
+	'dark',
+)
+# Keyword arguments of Article.set_config a request may set. Paths and
+# extensions stay at their defaults, they are not for clients to choose
+config_options = {
+	'profile': bool,
+}
+
+# Sources a request may write. Anything executed or included verbatim by
+# Sphinx or LaTeX (conf.py, extensions, .tex, Makefile) is rejected. The
+# content is a JSON string, so assets are text files.
+source_suffixes = {'.rst', '.bib', '.txt', '.csv', '.svg'}
+
+# Optional request fields and their types, see Job
+request_fields = {
+	'project': str,
+	'files': dict,
+	'index': list,
+	'config': dict,
+	'bibliography': str,
+	'bibliography_style': str,
+	'definitions': str,
+	'custom_words': list,
+	'preview': str,
+	'lint': bool,
+	'latex_units': bool,
+	'use_cache': bool,
+	'priority': int,
+}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+finished_states = {SUCCEEDED, FAILED, CANCELLED}
+
+
+def _relative_path(name: str) -> Path:
+	if not isinstance(name, str) or not name.strip() or '\n' in name:
+		raise ValueError(f"Invalid file name: {name!r}")
+
+	path = Path(name)
+	if path.is_absolute() or '..' in path.parts:
+		raise ValueError(f"Invalid file name: {name!r}")
+	return path
+
+
+def _source_path(name: str) -> Path:
+	path = _relative_path(name)
+	if path.suffix not in source_suffixes:
+		raise ValueError(
+			f"Cannot write {name!r}, only {', '.join(sorted(source_suffixes))} "
+			"files are accepted"
+		)
+	return path
+
+
+def _check_type(name: str, value, expected: type):
+	# bool is an int, but not a priority
+	if not isinstance(value, expected) or (
+		expected is int and isinstance(value, bool)
+	):
+		raise ValueError(f"{name} must be of type {expected.__name__}")
+
+
+def validate_request(request) -> dict:
+	'''Checks the shape of a submitted request, raising ``ValueError``.'''
+
+	if not isinstance(request, dict):
+		raise ValueError("The request must be a JSON object")
+
+	if unknown := request.keys() - request_fields.keys():
+		raise ValueError(f"Unknown request fields: {', '.join(sorted(unknown))}")
+
+	for name, value in request.items():
+		if value is not None:
+			_check_type(name, value, request_fields[name])
+
+	for name, content in (request.get('files') or {}).items():
+		_source_path(name)
+		_check_type(f"files[{name!r}]", content, str)
+
+	for entry in request.get('index') or ():
+		_relative_path(entry)
+
+	for word in request.get('custom_words') or ():
+		_check_type('custom_words entries', word, str)
+
+	if request.get('preview') is not None:
+		if _source_path(request['preview']).suffix != '.rst':
+			raise ValueError("preview must be a .rst file")
+
+	style = request.get('bibliography_style')
+	if style is not None and not style_pattern.fullmatch(style):
+		raise ValueError(f"Invalid bibliography style: {style!r}")
+
+	config = request.get('config')
+	if config is not None:
+		if missing := [name for name in config_fields if name not in config]:
+			raise ValueError(f"Missing config fields: {', '.join(missing)}")
+
+		allowed = {*config_fields, *config_options}
+		if unknown := config.keys() - allowed:
+			raise ValueError(f"Unknown config fields: {', '.join(sorted(unknown))}")
+
+		for name in config_fields:
+			_check_type(f"config.{name}", config[name], bool if name == 'dark' else str)
+		for name, expected in config_options.items():
+			if name in config:
+				_check_type(f"config.{name}", config[name], expected)
+
+	return request
+
+
+@dataclass
+class Job:
+	'''A build request and its progress.
+
+	``request`` is the submitted JSON object:
+
+	- ``files``: ``{name: content}`` of ``.rst``, ``.bib`` and text assets
+	- ``index``: toctree entries for ``index.rst``
+	- ``config``: the fields of ``Article.set_config`` and ``profile``
+	- ``bibliography``, ``bibliography_style``, ``definitions``
+	- ``custom_words``: words added to the custom dictionary
+	- ``preview``: a source file to build alone, see ``Article.preview``
+	- ``project``: shares the workspace and incremental state across jobs
+	- ``lint``, ``latex_units``, ``use_cache`` and ``priority``
+	'''
+
+	id: str
+	request: dict
+	project: str
+	priority: int = field(default=0)
+
+	state: str = field(default=QUEUED)
+	success: Optional[bool] = field(default=None)
+	error: Optional[str] = field(default=None)
+	submitted: float = field(default_factory=time.time)
+	started: Optional[float] = field(default=None)
+	finished: Optional[float] = field(default=None)
+	pdf: Optional[Path] = field(default=None)
+
+	article: Optional[Article] = field(default=None, repr=False)
+	output: deque = field(default_factory=lambda: deque(maxlen=200), repr=False)
+	cancelled: threading.Event = field(
+		default_factory=threading.Event,
+		repr=False,
+	)
+
+	def status(self, *, logs: bool = False) -> dict:
+		status = dict(
+			id=self.id,
+			project=self.project,
+			priority=self.priority,
+			state=self.state,
+			success=self.success,
+			error=self.error,
+			submitted=self.submitted,
+			started=self.started,
+			finished=self.finished,
+			pdf=self.pdf is not None,
+			output=list(self.output),
+		)
+
+		if self.article is not None:
+			snapshot = self.article.snapshot()
+			status['messages'] = [
+				asdict(message)
+				for message in snapshot['build_messages']
+			]
+			status['lint'] = {
+				file: dict(syntax=syntax_errors, language=language_errors)
+				for file, (syntax_errors, language_errors)
+				in snapshot['file_errors'].items()
+			}
+			if logs:
+				status['sphinx_logs'] = snapshot['sphinx_logs']
+				status['latex_logs'] = snapshot['latex_logs']
+
+		return status
+
+
+@dataclass
+class BuildService:
+	'''Runs article builds from a priority queue on worker threads.
+
+	The workers share one LanguageTool server, the extension caches and
+	the build cache. Sphinx and LaTeX still start as subprocesses for
+	every job, so their state is only reused through those caches.
+	Jobs with a lower ``priority`` run first; jobs of the same project run
+	one at a time in the project workspace under ``root``.
+	'''
+
+	root: Path = field(default=default_cache_dir / 'service')
+	workers: int = field(default=2)
+	cache_dir: Path = field(default=default_cache_dir)
+	build_cache: Optional[BuildCache] = field(default_factory=BuildCache)
+	enable_linter: bool = field(default=True)
+	linter_lang: str = field(default='en-US')
+	linter_draft: bool = field(default=False)
+	# Finished jobs kept for polling, the oldest are forgotten first
+	max_finished_jobs: int = field(default=100)
+
+	def __post_init__(self):
+		self.root = Path(self.root)
+		self.jobs: dict[str, Job] = {}
+		self._queue = queue.PriorityQueue()
+		self._sequence = itertools.count()
+		self._lock = threading.Lock()
+		self._project_locks: dict[str, threading.Lock] = {}
+		self._linter_lock = threading.Lock()
+		self._tool = None
+		self._threads: list[threading.Thread] = []
+
+	def start(self):
+		self.root.mkdir(parents=True, exist_ok=True)
+		Article.reload_templates()
+
+		# Starts LanguageTool before the first job needs it
+		if self.enable_linter and RSTLinter is not None and RSTLinter.available():
+			self._new_linter()
+
+		for index in range(self.workers):
+			thread = threading.Thread(
+				target=self._work,
+				name=f"rst-articles-worker-{index}",
+				daemon=True,
+			)
+			thread.start()
+			self._threads.append(thread)
+
+	def stop(self):
+		for job in list(self.jobs.values()):
+			self.cancel(job.id)
+
+		for _ in self._threads:
+			self._queue.put((float('inf'), next(self._sequence), None))
+		for thread in self._threads:
+			thread.join()
+		self._threads.clear()
+
+	def submit(self, request: dict) -> Job:
+		validate_request(request)
+
+		job_id = uuid.uuid4().hex
+		project = request.get('project') or f"job-{job_id}"
+		if not project_name_pattern.fullmatch(project):
+			raise ValueError(f"Invalid project name: {project!r}")
+
+		job = Job(
+			id=job_id,
+			request=request,
+			project=project,
+			priority=request.get('priority') or 0,
+		)
+		with self._lock:
+			self.jobs[job.id] = job
+			self._forget_finished()
+
+		self._queue.put((job.priority, next(self._sequence), job.id))
+		return job
+
+	def get(self, job_id: str) -> Optional[Job]:
+		return self.jobs.get(job_id)
+
+	def cancel(self, job_id: str) -> Optional[Job]:
+		job = self.jobs.get(job_id)
+		if job is None:
+			return None
+
+		job.cancelled.set()
+		if job.article is not None:
+			job.article.cancel()
+		return job
+
+	def workspace(self, project: str) -> Path:
+		return self.root / 'projects' / project
+
+	def _forget_finished(self):
+		finished = [
+			job
+			for job in self.jobs.values()
+			if job.state in finished_states
+		]
+		for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+			del self.jobs[job.id]
+			if job.pdf is not None:
+				job.pdf.unlink(missing_ok=True)
+			if job.project == f"job-{job.id}":
+				shutil.rmtree(self.workspace(job.project), ignore_errors=True)
+
+	def _new_linter(self) -> RSTLinter:
+		with self._linter_lock:
+			linter = RSTLinter(
+				self.linter_lang,
+				draft=self.linter_draft,
+				tool=self._tool,
+			)
+			self._tool = linter.get_tool()
+		return linter
+
+	def _project_lock(self, project: str) -> threading.Lock:
+		with self._lock:
+			return self._project_locks.setdefault(project, threading.Lock())
+
+	def _work(self):
+		while True:
+			_, _, job_id = self._queue.get()
+			if job_id is None:
+				return
+
+			job = self.jobs.get(job_id)
+			if job is None:
+				continue
+
+			if job.cancelled.is_set():
+				job.state = CANCELLED
+				job.finished = time.time()
+				continue
+
+			with self._project_lock(job.project):
+				job.state = RUNNING
+				job.started = time.time()
+				try:
+					job.success = self._run(job)
+				except Exception as e:
+					job.success = False
+					job.error = f"{type(e).__name__}: {e}"
+
+				if job.cancelled.is_set():
+					job.state = CANCELLED
+				elif job.success:
+					job.state = SUCCEEDED
+				else:
+					job.state = FAILED
+				job.finished = time.time()
+
+	def _run(self, job: Job) -> bool:
+		request = job.request
+		workspace = self.workspace(job.project).resolve()
+
+		lint = bool(
+			request.get('lint', True) and  # noqa: W504
+			self.enable_linter and  # noqa: W504
+			RSTLinter is not None and  # noqa: W504
+			RSTLinter.available()
+		)
+		job.article = article = Article(
+			source_dir=workspace / 'source',
+			build_dir=workspace / 'build',
+			cache_dir=self.cache_dir,
+			build_cache=self.build_cache,
+			latex_units=bool(request.get('latex_units', False)),
+			enable_linter=lint,
+			linter=self._new_linter() if lint else None,
+			_ext_path=workspace / '_ext',
+			on_output=job.output.append,
+		)
+		if job.cancelled.is_set():
+			return False
+
+		if request.get('config') is not None:
+			config = dict(request['config'])
+			positional = [config.pop(name) for name in config_fields]
+			article.set_config(*positional, **config)
+		elif not (article.source_dir / 'conf.py').exists():
+			raise ValueError("The first job of a project needs a config")
+
+		if request.get('custom_words'):
+			article.add_custom_words(*request['custom_words'])
+
+		if request.get('bibliography') is not None:
+			article.set_bibliography(
+				request['bibliography'],
+				style=request.get('bibliography_style', 'unsrt'),
+				enable_linter=False,
+			)
+
+		if request.get('definitions') is not None:
+			article.set_definitions(request['definitions'], enable_linter=lint)
+
+		if request.get('files'):
+			article.write_many(
+				{
+					_source_path(name): content
+					for name, content in request['files'].items()
+				},
+				enable_linter=lint,
+			)
+
+		if request.get('index') is not None:
+			article.set_index(*request['index'])
+
+		if job.cancelled.is_set():
+			return False
+
+		if request.get('preview') is not None:
+			success = article.preview(request['preview'])
+			pdf = article.build_dir / 'preview' / 'build' / 'doc.pdf'
+		else:
+			success = article.build(use_cache=request.get('use_cache', True))
+			pdf = article.build_dir / 'doc.pdf'
+
+		# Later jobs of the project overwrite the workspace PDF
+		if success and pdf.exists():
+			jobs_dir = self.root / 'jobs'
+			jobs_dir.mkdir(parents=True, exist_ok=True)
+			shutil.copy2(pdf, jobs_dir / f"{job.id}.pdf")
+			job.pdf = jobs_dir / f"{job.id}.pdf"
+
+		return success
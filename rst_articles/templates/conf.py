@@ -1,21 +1,32 @@
 import sys
+import json
+import os
 from pathlib import Path
 
 sys.path.insert(0, str((Path(__file__).parents[1] / "_ext").resolve()))
 
-extensions = [
-	"___1_{extensions}___",
-]
+extensions = ___1_{extensions}___  # noqa: E999
 bibtex_bibfiles = ['bibliography.bib']
-project = "___1_{project}___"
-title = "___1_{title}___"
-subtitle = "___1_{subtitle}___"
-author = "___1_{author}___"
-institution = "___1_{institution}___"
+project = ___1_{project}___  # noqa: E999
+title = ___1_{title}___  # noqa: E999
+subtitle = ___1_{subtitle}___  # noqa: E999
+author = ___1_{author}___  # noqa: E999
+institution = ___1_{institution}___  # noqa: E999
+# Escaped for the title page and the headers
+latex_title = ___1_{latex_title}___  # noqa: E999
+latex_subtitle = ___1_{latex_subtitle}___  # noqa: E999
+latex_author = ___1_{latex_author}___  # noqa: E999
+latex_institution = ___1_{latex_institution}___  # noqa: E999
 numfig = True
 
+profile_extensions = ___1_{profile}___  # noqa: E999
+
 dark = ___1_{dark}___  # noqa: E999
 
+# Overrides of the variant being written, see Article.build(variants=...)
+variant = json.loads(os.environ.get('RST_ARTICLES_VARIANT') or '{}')
+dark = variant.get('dark', dark)
+
 if dark:
 	background_color = 'black'
 	text_color = 'white'
@@ -42,10 +53,10 @@ except FileNotFoundError:
 	abstract = None
 
 for placeholder, replacement in {
-	r'\title': title,
-	r'\subtitle': subtitle,
-	r'\name': author,
-	r'\institution': institution,
+	r'\title': latex_title,
+	r'\subtitle': latex_subtitle,
+	r'\name': latex_author,
+	r'\institution': latex_institution,
 	r'\abstract': abstract,
 }.items():
 	if replacement is not None:
@@ -60,10 +71,10 @@ preamble = Path('preamble.tex').read_text()
 
 preamble = preamble.replace(
 	'___2_{author}___',
-	author
+	latex_author
 ).replace(
 	'___2_{title}___',
-	title
+	latex_title
 )
 
 if background_color is not None:
@@ -113,6 +124,8 @@ latex_elements = {
 if document_class is not None:
 	latex_elements['documentclass'] = document_class
 
+latex_elements.update(variant.get('latex_elements', {}))
+
 # In conf.py
 latex_documents = [
 	(
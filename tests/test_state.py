@@ -0,0 +1,80 @@
+from pathlib import Path
+import tempfile
+import tarfile
+import unittest
+
+from rst_articles.notebook.state import StateArchive
+
+
+class StateArchiveTest(unittest.TestCase):
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.tmp = Path(self._tmp.name)
+
+		self.source_dir = self.tmp / 'source'
+		self.source_dir.mkdir()
+		(self.source_dir / 'index.rst').write_text("Index\n")
+
+		self.build_dir = self.tmp / 'build'
+		(self.build_dir / '.doctrees').mkdir(parents=True)
+		(self.build_dir / 'doc.tex').write_text("tex\n")
+		(self.build_dir / '.doctrees' / 'index.doctree').write_bytes(b"tree")
+		# Articles link bibliographies and figures into the build directory
+		(self.tmp / 'refs.bib').write_text("@misc{key}\n")
+		(self.build_dir / 'refs.bib').symlink_to(self.tmp / 'refs.bib')
+
+		self.archive = StateArchive(self.tmp / 'state.tar.gz')
+
+	def tearDown(self):
+		self._tmp.cleanup()
+
+	def test_round_trip(self):
+		self.assertTrue(
+			self.archive.save({'build': self.build_dir}, source_dir=self.source_dir)
+		)
+		self.assertFalse(
+			self.archive.save({'build': self.build_dir}, source_dir=self.source_dir)
+		)
+
+		target = self.tmp / 'restored'
+		restored = self.archive.restore({'build': target})
+
+		self.assertEqual(restored.files, 3)
+		self.assertIn('index.rst', restored.sources)
+		self.assertEqual((target / 'doc.tex').read_text(), "tex\n")
+		self.assertEqual(
+			(target / '.doctrees' / 'index.doctree').read_bytes(),
+			b"tree",
+		)
+		# Symlinks are restored as regular files with the linked contents
+		self.assertFalse((target / 'refs.bib').is_symlink())
+		self.assertEqual((target / 'refs.bib').read_text(), "@misc{key}\n")
+		self.assertEqual(
+			(target / 'doc.tex').stat().st_mtime_ns,
+			(self.build_dir / 'doc.tex').stat().st_mtime_ns,
+		)
+
+	def test_incomplete_archive_writes_nothing(self):
+		self.archive.save({'build': self.build_dir}, source_dir=self.source_dir)
+
+		# Keeps the manifest, drops the last object
+		truncated = self.tmp / 'truncated.tar.gz'
+		with (
+			tarfile.open(self.archive.path, 'r:gz') as source,
+			tarfile.open(truncated, 'w:gz') as target,
+		):
+			for member in source.getmembers()[:-1]:
+				target.addfile(member, source.extractfile(member))
+
+		restored_dir = self.tmp / 'restored'
+		with self.assertRaises(ValueError):
+			StateArchive(truncated).restore({'build': restored_dir})
+
+		self.assertEqual(
+			[path for path in restored_dir.rglob('*') if path.is_file()],
+			[],
+		)
+
+
+if __name__ == '__main__':
+	unittest.main()